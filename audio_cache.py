@@ -0,0 +1,255 @@
+import asyncio
+import atexit
+import collections
+import hashlib
+import json
+import logging
+import mmap
+import os
+import time
+
+import discord
+from discord.oggparse import OggStream
+
+import metrics
+from ffmpeg_admission import ffmpeg_admission, FFmpegBusy, WEIGHT_COPY, WEIGHT_TRANSCODE
+from media_cache import track_key
+
+logger = logging.getLogger(__name__)
+
+# Cache disque des pistes souvent jouées, stockées en Ogg Opus : une piste
+# jouée AUDIO_CACHE_MIN_PLAYS fois est téléchargée en arrière-plan, puis lue
+# depuis le disque sans ffmpeg ni requête vers YouTube.
+AUDIO_CACHE_DIR = os.getenv('AUDIO_CACHE_DIR', '')  # désactivé si vide
+AUDIO_CACHE_MAX_BYTES = int(os.getenv('AUDIO_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv('AUDIO_CACHE_MIN_PLAYS', '3'))
+AUDIO_CACHE_MMAP = os.getenv('AUDIO_CACHE_MMAP', '0') == '1'
+AUDIO_CACHE_DOWNLOADS = int(os.getenv('AUDIO_CACHE_DOWNLOADS', '1'))  # téléchargements simultanés
+AUDIO_CACHE_BITRATE = os.getenv('AUDIO_CACHE_BITRATE', '128k')  # si la source n'est pas déjà en Opus
+DOWNLOAD_TIMEOUT = 600
+MAX_TRACKED_PLAYS = 10000  # pistes non cachées dont on compte les lectures
+
+INDEX_FILE = 'index.json'
+
+lookups = metrics.Counter('bot_audio_cache_lookups_total', 'Recherches dans le cache audio disque', ('result',))
+downloads = metrics.Counter('bot_audio_cache_downloads_total', 'Téléchargements vers le cache audio', ('status',))
+
+
+class LocalOpusAudio(discord.AudioSource):
+    # Lit les trames d'un fichier Ogg Opus directement (pas de processus ffmpeg)
+
+    def __init__(self, path, use_mmap=AUDIO_CACHE_MMAP, start_at=0):
+        self._file = open(path, 'rb')
+        self._map = None
+        stream = self._file
+        if use_mmap:
+            self._map = stream = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._packets = OggStream(stream).iter_packets()
+        # Reprise en cours de piste : trames de 20 ms sautées sans être décodées
+        for _ in range(int(start_at / 0.02)):
+            if not self.read():
+                break
+
+    def read(self):
+        for packet in self._packets:
+            # En-têtes Ogg Opus : pas des trames audio
+            if packet.startswith((b'OpusHead', b'OpusTags')):
+                continue
+            return packet
+        return b''
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class AudioCache:
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES, min_plays=AUDIO_CACHE_MIN_PLAYS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self._entries = collections.OrderedDict()  # clé -> (fichier, taille), du moins au plus récemment joué
+        self._plays = collections.OrderedDict()  # clé -> nombre de lectures (pistes pas encore cachées)
+        self._downloads = {}
+        self._semaphore = None
+        self.size = 0
+        # Métriques
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            self.load()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def lookup(self, info):
+        # Chemin du fichier local si la piste est en cache, sinon None
+        if not self.enabled:
+            return None
+        key = track_key(info)
+        entry = self._entries.get(key)
+        if entry is not None and os.path.exists(self._path(entry[0])):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            lookups.inc('hit')
+            return self._path(entry[0])
+        if entry is not None:
+            self._remove(key)
+        self.misses += 1
+        lookups.inc('miss')
+        return None
+
+    def record_play(self, info):
+        # Compte les lectures ; au seuil, télécharge la piste en arrière-plan
+        if not self.enabled or not info or not info.get('url'):
+            return
+        key = track_key(info)
+        if key in self._entries or key in self._downloads:
+            return
+        plays = self._plays.pop(key, 0) + 1
+        if plays < self.min_plays:
+            self._plays[key] = plays
+            while len(self._plays) > MAX_TRACKED_PLAYS:
+                self._plays.popitem(last=False)
+            return
+        task = asyncio.create_task(self._download(key, info))
+        self._downloads[key] = task
+        task.add_done_callback(lambda _: self._downloads.pop(key, None))
+
+    async def _download(self, key, info):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(AUDIO_CACHE_DOWNLOADS)
+        filename = hashlib.sha1(key.encode()).hexdigest() + '.opus'
+        tmp_path = self._path(filename + '.part')
+        # Opus d'origine : simple remuxage ; sinon encodage en Opus
+        if info.get('acodec') == 'opus':
+            codec = ['-c:a', 'copy']
+            weight = WEIGHT_COPY
+        else:
+            codec = ['-ar', '48000', '-ac', '2', '-c:a', 'libopus', '-b:a', AUDIO_CACHE_BITRATE]
+            weight = WEIGHT_TRANSCODE
+        args = ['-nostdin', '-loglevel', 'error', '-y',
+                '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+                '-i', info['url'], '-vn', *codec, '-f', 'opus', tmp_path]
+        from music import FFMPEG_PATH
+        async with self._semaphore:
+            # Le processus compte dans le budget ffmpeg global, comme les lectures
+            try:
+                await ffmpeg_admission.acquire(weight)
+            except FFmpegBusy:
+                downloads.inc('skipped')
+                # Budget plein : nouvel essai à la prochaine lecture de la piste
+                self._plays[key] = self.min_plays - 1
+                return
+            start = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    FFMPEG_PATH, *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+                try:
+                    _, stderr = await asyncio.wait_for(process.communicate(), DOWNLOAD_TIMEOUT)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    raise
+                if process.returncode != 0:
+                    raise RuntimeError(stderr.decode(errors='replace').strip() or f"code {process.returncode}")
+                size = os.path.getsize(tmp_path)
+                if size > self.max_bytes:
+                    raise RuntimeError(f"fichier trop volumineux ({size} octets)")
+                os.replace(tmp_path, self._path(filename))
+            except Exception as e:
+                downloads.inc('error')
+                logger.error("Mise en cache audio de %s échouée : %s", key, e)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return
+            finally:
+                ffmpeg_admission.release(weight)
+        downloads.inc('ok')
+        self._add(key, filename, size)
+        self.save()
+        logger.info("Piste %s mise en cache (%.1f Mio, %.1f s)", key, size / 1048576, time.perf_counter() - start)
+
+    def _add(self, key, filename, size):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (filename, size)
+        self.size += size
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)), delete=True)
+            self.evictions += 1
+
+    def _remove(self, key, delete=False):
+        filename, size = self._entries.pop(key)
+        self.size -= size
+        if delete:
+            # Une lecture en cours garde son descripteur : la suppression ne l'interrompt pas
+            try:
+                os.remove(self._path(filename))
+            except OSError:
+                pass
+
+    def stats(self):
+        lookups_total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups_total if lookups_total else 0.0,
+            'evictions': self.evictions,
+            'downloading': len(self._downloads),
+        }
+
+    def load(self):
+        # L'index garde l'ordre LRU ; les fichiers absents sont ignorés
+        try:
+            index_path = self._path(INDEX_FILE)
+            if not os.path.exists(index_path):
+                return
+            with open(index_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            for key, filename in saved:
+                path = self._path(filename)
+                if os.path.exists(path):
+                    self._add(key, filename, os.path.getsize(path))
+            logger.info("Cache audio chargé : %s pistes, %.1f Mio", len(self._entries), self.size / 1048576)
+        except Exception as e:
+            logger.error("Erreur lors du chargement du cache audio %s: %s", self.directory, e)
+
+    def save(self):
+        if not self.enabled:
+            return
+        try:
+            index_path = self._path(INDEX_FILE)
+            tmp_path = index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump([(key, filename) for key, (filename, _) in self._entries.items()], f)
+            os.replace(tmp_path, index_path)
+        except Exception as e:
+            logger.error("Erreur lors de l'enregistrement du cache audio %s: %s", self.directory, e)
+
+
+audio_cache = AudioCache()
+atexit.register(audio_cache.save)
+
+metrics.Gauge('bot_audio_cache_bytes', 'Taille du cache audio disque', lambda: audio_cache.size)
+metrics.Gauge('bot_audio_cache_entries', 'Pistes dans le cache audio disque', lambda: len(audio_cache))
+metrics.Gauge('bot_audio_cache_hit_ratio', 'Taux de succès du cache audio disque',
+              lambda: audio_cache.stats()['hit_rate'])
@@ -0,0 +1,49 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard import RankIndex, LEADERBOARD_PAGE_SIZE
+
+# Classement avec 1M de membres synthétiques :
+#     python benchmarks/bench_leaderboard.py [nombre de membres]
+
+QUERIES = 10000
+
+
+def timed(label, func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    per_op_us = (time.perf_counter() - start) / count * 1e6
+    print(f"{label:<28} {per_op_us:>10.2f} µs/op")
+
+
+def main():
+    members = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(42)
+    start = time.perf_counter()
+    index = RankIndex((user_id, rng.randint(0, 500_000)) for user_id in range(members))
+    print(f"Construction ({members} membres) : {time.perf_counter() - start:.2f} s")
+
+    user_ids = [rng.randrange(members) for _ in range(QUERIES)]
+    pages = [rng.randrange(members // LEADERBOARD_PAGE_SIZE) for _ in range(QUERIES)]
+    it_users = iter(user_ids)
+    it_pages = iter(pages)
+    it_updates = iter(user_ids)
+
+    timed("rang d'un membre", lambda: index.rank(next(it_users)), QUERIES)
+    timed("page du classement", lambda: index.page(next(it_pages) * LEADERBOARD_PAGE_SIZE, LEADERBOARD_PAGE_SIZE), QUERIES)
+    timed("gain d'XP (mise à jour)", lambda: index.update(next(it_updates), rng.randint(0, 500_000)), QUERIES)
+
+    # Référence : tri complet du dict à chaque appel
+    xp = {user_id: rng.randint(0, 500_000) for user_id in range(members)}
+    start = time.perf_counter()
+    sorted(xp.items(), key=lambda item: item[1], reverse=True)[:LEADERBOARD_PAGE_SIZE]
+    print(f"{'tri complet (référence)':<28} {(time.perf_counter() - start) * 1e6:>10.2f} µs/op")
+
+
+if __name__ == '__main__':
+    main()
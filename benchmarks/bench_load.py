@@ -0,0 +1,407 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Test de charge hors ligne : les vrais handlers de main.py (on_message, commandes,
+# commandes personnalisées, musique) sont appelés avec de faux objets Discord et un
+# faux extracteur yt-dlp, sans connexion à Discord.
+#     python benchmarks/bench_load.py                      comparaison avec la référence
+#     python benchmarks/bench_load.py --save               enregistre la référence
+#     python benchmarks/bench_load.py --rates 1000,60000 --duration 10 --extract-latency 2
+
+RATES = (1000, 10000, 100000)  # messages simulés par minute
+DURATION = 5.0
+EXTRACT_LATENCY = 0.5  # secondes par extraction yt-dlp simulée
+TRACK_SECONDS = 2.0  # durée de lecture simulée d'un morceau
+GUILDS = 10
+USERS = 1000
+TOLERANCE = 0.5
+LAG_INTERVAL = 0.005
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'load_baseline.json')
+
+# Répartition des messages : (type, proportion)
+MIX = (
+    ('chat', 0.70),
+    ('banned', 0.08),
+    ('custom', 0.10),
+    ('command', 0.07),
+    ('unknown', 0.03),
+    ('play', 0.02),
+)
+BANNED_WORDS = ['spam', 'arnaque', 'pub', 'insulte', 'triche']
+CUSTOM_CMDS = {'regles': 'Bienvenue {user} sur {server} !', 'salut': 'Salut {mention} ({args})'}
+COMMANDS = ['!url', '!rank', '!leaderboard', '!queue']
+
+# Variables lues à l'import de main.py
+os.environ.setdefault('DISCORD_TOKEN', 'benchmark')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('MUSIC_PRELOAD', '0')
+os.environ.setdefault('XP_COOLDOWN', '0')
+# Sans limiteur : la configuration envoie des dizaines d'écritures du même modérateur, et
+# les mesures portent sur le coût des handlers, pas sur les refus (RATE_LIMIT=1 pour l'inclure)
+os.environ.setdefault('RATE_LIMIT', '0')
+
+import discord
+from discord.ext import commands
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class FakePermissions:
+    # Toutes les permissions valent is_mod
+    def __init__(self, is_mod):
+        self.is_mod = is_mod
+
+    def __getattr__(self, name):
+        return self.is_mod
+
+
+class FakeMember(discord.Member):
+    # Sous-classe de discord.Member pour passer les isinstance() de main.py,
+    # sans l'état interne de discord.py
+    def __init__(self, user_id, guild, is_mod=False, bot=False):
+        self._id = user_id
+        self._guild = guild
+        self.is_mod = is_mod
+        self._bot = bot
+        self.voice_channel = None
+
+    id = property(lambda self: self._id)
+    bot = property(lambda self: self._bot)
+    guild = property(lambda self: self._guild)
+    name = display_name = property(lambda self: f'membre{self._id}')
+    mention = property(lambda self: f'<@{self._id}>')
+    voice = property(lambda self: self.voice_channel and FakeVoiceState(self.voice_channel))
+    guild_permissions = property(lambda self: FakePermissions(self.is_mod))
+
+    def __str__(self):
+        return self.name
+
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class FakeSource(discord.AudioSource):
+    def read(self):
+        return b''
+
+    def is_opus(self):
+        return True
+
+
+class FakeVoiceClient:
+    def __init__(self, channel):
+        self.channel = channel
+        self._playing = None
+        self._after = None
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self._playing is not None
+
+    def is_paused(self):
+        return False
+
+    def play(self, source, after=None):
+        self._after = after
+        self._playing = asyncio.get_running_loop().call_later(TRACK_SECONDS, self._finish)
+
+    def _finish(self):
+        self._playing = None
+        if self._after:
+            self._after(None)
+
+    def stop(self):
+        if self._playing is not None:
+            self._playing.cancel()
+            self._finish()
+
+    def pause(self):
+        pass
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, force=False):
+        self.stop()
+        self.channel.guild.voice_client = None
+
+
+class FakeChannel:
+    type = discord.ChannelType.text
+
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.name = f'salon{channel_id}'
+        self.mention = f'<#{channel_id}>'
+        self.sent = 0
+
+    def permissions_for(self, member):
+        return FakePermissions(getattr(member, 'is_mod', True))
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+    async def connect(self, **kwargs):
+        self.guild.voice_client = FakeVoiceClient(self)
+        return self.guild.voice_client
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f'serveur{guild_id}'
+        self.voice_client = None
+        self.me = FakeMember(1, self, is_mod=True, bot=True)
+        self.text_channel = FakeChannel(guild_id * 10 + 1, self)
+        self.voice_channel = FakeChannel(guild_id * 10 + 2, self)
+        self.members = {}
+
+    def member(self, user_id, is_mod=False):
+        member = self.members.get(user_id)
+        if member is None:
+            member = self.members[user_id] = FakeMember(user_id, self, is_mod)
+            member.voice_channel = self.voice_channel
+        return member
+
+
+class FakeMessage:
+    _next_id = 1
+
+    def __init__(self, state, content, author, guild):
+        FakeMessage._next_id += 1
+        self.id = FakeMessage._next_id
+        self._state = state
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.channel = guild.text_channel
+        self.attachments = []
+        self.mentions = []
+        self.raw_mentions = []
+        self.pinned = False
+
+    async def delete(self):
+        pass
+
+
+class FakeUser:
+    id = 1
+    name = 'bot'
+
+
+def fake_extract(url, ydl_opts, cancel_event=None):
+    # Remplace yt-dlp : exécuté dans le pool d'extraction comme le vrai
+    time.sleep(EXTRACT_LATENCY)
+    return {'url': f'https://example.invalid/{abs(hash(url))}.webm', 'title': url, 'duration': TRACK_SECONDS,
+            'webpage_url': url, 'id': str(abs(hash(url))), 'acodec': 'opus', 'ext': 'webm', 'abr': 128}
+
+
+def make_message(main, rng, guilds):
+    guild = rng.choice(guilds)
+    author = guild.member(rng.randrange(2, USERS))
+    kind = rng.choices([kind for kind, _ in MIX], [weight for _, weight in MIX])[0]
+    if kind == 'chat':
+        content = 'bonjour tout le monde, ceci est un message ordinaire numéro %d' % rng.randrange(10 ** 6)
+    elif kind == 'banned':
+        content = 'regardez cette %s incroyable' % rng.choice(BANNED_WORDS)
+    elif kind == 'custom':
+        content = '!' + rng.choice(list(CUSTOM_CMDS)) + ' avec des arguments'
+    elif kind == 'command':
+        content = rng.choice(COMMANDS)
+    elif kind == 'unknown':
+        content = '!commandeinconnue'
+    else:
+        content = '!play https://youtu.be/%011d' % rng.randrange(50)
+    return kind, FakeMessage(main.bot._connection, content, author, guild)
+
+
+async def sample_lag(samples, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - start - LAG_INTERVAL))
+
+
+async def run_rate(main, guilds, rate, duration, seed):
+    # Arrivées en boucle ouverte : la latence est mesurée depuis l'heure d'arrivée
+    # prévue, les retards de la boucle sont donc comptés
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    count = max(1, int(rate * duration / 60))
+    interval = 60 / rate
+    latencies = {kind: [] for kind, _ in MIX}
+    errors = 0
+    lag = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(sample_lag(lag, stop))
+
+    async def handle(kind, message, arrival):
+        nonlocal errors
+        try:
+            await main.on_message(message)
+        except Exception:
+            errors += 1
+        latencies[kind].append(loop.time() - arrival)
+
+    tasks = []
+    start = loop.time()
+    for i in range(count):
+        arrival = start + i * interval
+        delay = arrival - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind, message = make_message(main, rng, guilds)
+        tasks.append(asyncio.create_task(handle(kind, message, arrival)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+    stop.set()
+    await lag_task
+
+    # Écriture différée de l'XP puis des autres modifications (remplace l'ancien save_data)
+    flush_start = time.perf_counter()
+    main.xp_engine.flush()
+    main.storage.flush()
+    flush_ms = (time.perf_counter() - flush_start) * 1000
+
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        'messages': count,
+        'throughput': round(count / elapsed, 1),
+        'p50_ms': round(percentile(everything, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(everything, 0.99) * 1000, 2),
+        'lag_p99_ms': round(percentile(lag, 0.99) * 1000, 2),
+        'lag_max_ms': round(max(lag, default=0.0) * 1000, 2),
+        'flush_ms': round(flush_ms, 2),
+        'errors': errors,
+        'by_kind': {kind: round(percentile(values, 0.99) * 1000, 2) for kind, values in latencies.items() if values},
+    }
+
+
+async def setup(main):
+    import extraction
+    import loudness
+    import music
+
+    extraction._extract_info = fake_extract
+
+    async def fake_create_source(info, start_at=0):
+        return FakeSource()
+
+    music.create_source = fake_create_source
+    music.audio_cache.directory = ''
+    loudness.LOUDNESS_ENABLED = False
+
+    async def fake_send(self, content=None, **kwargs):
+        return None
+
+    commands.Context.send = fake_send
+    main.bot._connection.user = FakeUser()
+    await main.load_music()
+
+    guilds = [FakeGuild(guild_id) for guild_id in range(1, GUILDS + 1)]
+    # Configuration des serveurs par les vraies commandes de modération
+    for guild in guilds:
+        mod = guild.member(USERS + 1, is_mod=True)
+        for word in BANNED_WORDS:
+            await main.on_message(FakeMessage(main.bot._connection, f'!addbanned {word}', mod, guild))
+        for name, response in CUSTOM_CMDS.items():
+            await main.on_message(FakeMessage(main.bot._connection, f'!addcmd {name} {response}', mod, guild))
+    main.storage.flush()
+    # Sans configuration complète, "banned" et "custom" ne mesureraient que les commandes inconnues
+    for guild in guilds:
+        data = main.storage.load_guild(guild.id)
+        missing = set(BANNED_WORDS) - set(data['banned_words']) or set(CUSTOM_CMDS) - set(data['custom_cmds'])
+        if missing:
+            raise RuntimeError(f"Configuration incomplète du serveur {guild.id} : {sorted(missing)} manquant(s)")
+    return guilds
+
+
+def compare(results, baseline):
+    failed = False
+    for rate, result in results.items():
+        base = baseline.get(rate)
+        if not base:
+            continue
+        # Marge absolue de 2 ms : en dessous, c'est du bruit de mesure
+        if result['p99_ms'] > base['p99_ms'] * (1 + TOLERANCE) + 2:
+            print(f"ÉCHEC {rate}/min : p99 {result['p99_ms']} ms (référence {base['p99_ms']} ms)")
+            failed = True
+        if result['throughput'] < base['throughput'] * (1 - TOLERANCE):
+            print(f"ÉCHEC {rate}/min : débit {result['throughput']}/s (référence {base['throughput']}/s)")
+            failed = True
+    return failed
+
+
+async def run(args):
+    global EXTRACT_LATENCY
+    EXTRACT_LATENCY = args.extract_latency
+    with tempfile.TemporaryDirectory() as cwd:
+        os.chdir(cwd)  # base SQLite jetable
+        import main
+        import extraction
+        import music
+
+        async with main.bot:
+            guilds = await setup(main)
+            results = {}
+            for i, rate in enumerate(args.rates):
+                result = await run_rate(main, guilds, rate, args.duration, seed=i)
+                results[str(rate)] = result
+                print(f"{rate:>7}/min  {result['messages']:>6} msg  débit {result['throughput']:>8.1f}/s  "
+                      f"p50 {result['p50_ms']:>7.2f} ms  p99 {result['p99_ms']:>7.2f} ms  "
+                      f"retard boucle p99 {result['lag_p99_ms']:>6.2f} ms (max {result['lag_max_ms']:.1f})  "
+                      f"flush {result['flush_ms']:.1f} ms  erreurs {result['errors']}")
+                print("          p99 par type : " + ", ".join(f"{kind} {ms} ms" for kind, ms in result['by_kind'].items()))
+            for player in list(music.players.values()):
+                await player.stop()
+            # Les extractions en cours doivent se terminer avant la fermeture de la boucle
+            while extraction.extraction_pool.queue_depth:
+                await asyncio.sleep(0.05)
+            print(f"Extractions : {extraction.extraction_pool.stats()}")
+        main.storage.close()
+        os.chdir(ROOT)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge hors ligne du bot")
+    parser.add_argument('--rates', default=','.join(map(str, RATES)),
+                        type=lambda value: [int(rate) for rate in value.split(',')])
+    parser.add_argument('--duration', type=float, default=DURATION)
+    parser.add_argument('--extract-latency', type=float, default=EXTRACT_LATENCY)
+    parser.add_argument('--save', action='store_true')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.save:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+            f.write('\n')
+        print(f"Référence enregistrée dans {BASELINE_FILE}")
+        return
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding='utf-8') as f:
+            sys.exit(1 if compare(results, json.load(f)) else 0)
+
+
+if __name__ == '__main__':
+    main()
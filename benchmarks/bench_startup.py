@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Coût des imports au démarrage (python -X importtime) :
+#     python benchmarks/bench_startup.py          comparaison avec la référence
+#     python benchmarks/bench_startup.py --save   enregistre la référence
+# Échoue si yt-dlp est importé au démarrage ou si l'import de main.py
+# dépasse la référence de plus de TOLERANCE.
+
+RUNS = 5
+TOLERANCE = 0.5
+TOP = 15
+FORBIDDEN = ('yt_dlp',)  # chargés paresseusement, jamais au démarrage
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+
+
+def measure():
+    # main.py est importé sans lancer le bot, dans un dossier vide (base SQLite jetable)
+    env = dict(os.environ, DISCORD_TOKEN='benchmark', PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='1')
+    with tempfile.TemporaryDirectory() as cwd:
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                                cwd=cwd, env=env, capture_output=True, text=True, check=True)
+        wall = time.perf_counter() - start
+    modules = {}  # module -> secondes (cumul), tous niveaux confondus
+    direct = []  # imports faits directement par main.py
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Profondeur : deux espaces par niveau ; 0 = main, 1 = imports directs de main.py
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name, seconds = name.strip(), int(cumulative) / 1e6
+        modules[name] = seconds
+        # importtime affiche les sous-modules avant leur parent
+        if depth == 1:
+            children.append((name, seconds))
+        elif depth == 0:
+            if name == 'main':
+                direct = children
+            children = []
+    return wall, modules, direct
+
+
+def main():
+    runs = [measure() for _ in range(RUNS)]
+    # Minimum sur plusieurs lancements : le moins perturbé par la machine
+    wall = min(run[0] for run in runs)
+    _, modules, direct = min(runs, key=lambda run: run[1].get('main', 0.0))
+    imports = modules.get('main', 0.0)
+
+    print(f"Lancement de l'interpréteur + import de main : {wall * 1000:.0f} ms (minimum sur {RUNS})")
+    print(f"Import de main.py : {imports * 1000:.0f} ms")
+    print("Imports de main.py les plus coûteux :")
+    for name, seconds in sorted(direct, key=lambda item: -item[1])[:TOP]:
+        print(f"  {name:<30} {seconds * 1000:>8.1f} ms")
+
+    failed = False
+    for name in FORBIDDEN:
+        if name in modules:
+            print(f"ÉCHEC : {name} est importé au démarrage")
+            failed = True
+
+    if '--save' in sys.argv:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'import_main_ms': round(imports * 1000, 1), 'wall_ms': round(wall * 1000, 1)}, f, indent=4)
+            f.write('\n')
+        print(f"Référence enregistrée dans {BASELINE_FILE}")
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding='utf-8') as f:
+            baseline = json.load(f)
+        limit = baseline['import_main_ms'] * (1 + TOLERANCE)
+        print(f"Référence : {baseline['import_main_ms']:.0f} ms (limite {limit:.0f} ms)")
+        if imports * 1000 > limit:
+            print("ÉCHEC : régression du temps d'import")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
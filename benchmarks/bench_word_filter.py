@@ -0,0 +1,58 @@
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from word_filter import WordFilter
+
+# Coût par message du filtre de mots interdits selon la taille de la liste :
+#     python benchmarks/bench_word_filter.py
+
+MESSAGES = 2000
+UPDATES = 200  # ajouts puis suppressions (!addbanned / !removebanned) sur une liste déjà compilée
+MESSAGE_LENGTH = 200
+SIZES = (10, 100, 1000, 10000)
+
+
+def random_word(rng):
+    return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+
+
+def random_message(rng):
+    words = []
+    while sum(len(w) + 1 for w in words) < MESSAGE_LENGTH:
+        words.append(random_word(rng))
+    return ' '.join(words)
+
+
+def main():
+    rng = random.Random(42)
+    messages = [random_message(rng) for _ in range(MESSAGES)]
+    print(f"{'mots':>8} {'compilation (ms)':>18} {'µs/message':>12} {'µs/mise à jour':>16}")
+    for size in SIZES:
+        words = [random_word(rng) for _ in range(size)]
+        start = time.perf_counter()
+        word_filter = WordFilter(words)
+        build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for message in messages:
+            word_filter.find(message)
+        per_message_us = (time.perf_counter() - start) / MESSAGES * 1e6
+        # Chaque mise à jour est suivie d'une recherche : son coût inclut toute recompilation
+        updates = [random_word(rng) for _ in range(UPDATES)]
+        start = time.perf_counter()
+        for word in updates:
+            word_filter.add(word)
+            word_filter.find('')
+        for word in updates:
+            word_filter.remove(word)
+            word_filter.find('')
+        per_update_us = (time.perf_counter() - start) / (2 * UPDATES) * 1e6
+        print(f"{size:>8} {build_ms:>18.1f} {per_message_us:>12.1f} {per_update_us:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import itertools
+import os
+import sys
+
+# Estimation de la mémoire occupée par les caches de discord.py. Chaque cache
+# est estimé sur un échantillon : taille moyenne d'une entrée × nombre d'entrées.
+# Seuls les attributs propres à l'objet sont comptés (chaînes, nombres,
+# conteneurs), pas les objets partagés (serveur, état de connexion, ...).
+
+CACHE_SAMPLE = int(os.getenv('CACHE_SAMPLE', '50'))
+
+_ATOMIC = (str, bytes, int, float, bool, type(None))
+
+
+def _value_size(value, depth=0):
+    size = sys.getsizeof(value)
+    if depth < 2 and isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_value_size(item, depth + 1) for item in value if isinstance(item, _ATOMIC + (list, tuple)))
+    elif depth < 2 and isinstance(value, dict):
+        size += sum(_value_size(k, depth + 1) + _value_size(v, depth + 1) for k, v in value.items()
+                    if isinstance(v, _ATOMIC + (list, tuple, dict)))
+    return size
+
+
+def entry_size(obj):
+    size = sys.getsizeof(obj)
+    names = set(getattr(obj, '__dict__', ()))
+    for cls in type(obj).__mro__:
+        names.update(getattr(cls, '__slots__', ()))
+    for name in names:
+        value = getattr(obj, name, None)
+        if isinstance(value, _ATOMIC + (list, tuple, set, frozenset, dict)) and not name.startswith('__'):
+            size += _value_size(value)
+    return size
+
+
+def estimate(entries, count):
+    sample = list(itertools.islice(entries, CACHE_SAMPLE))
+    if not sample:
+        return 0
+    return sum(entry_size(entry) for entry in sample) * count // len(sample)
+
+
+def cache_report(bot):
+    # {cache: (entrées, octets estimés)}
+    guilds = bot.guilds
+    members = sum(len(guild._members) for guild in guilds)
+    channels = sum(len(guild._channels) for guild in guilds)
+    roles = sum(len(guild._roles) for guild in guilds)
+    voice_states = sum(len(guild._voice_states) for guild in guilds)
+    emojis = len(bot.emojis) + len(bot.stickers)
+    messages = bot.cached_messages
+    report = {
+        'guilds': (len(guilds), estimate(iter(guilds), len(guilds))),
+        'members': (members, estimate(itertools.chain.from_iterable(g._members.values() for g in guilds), members)),
+        'users': (len(bot.users), estimate(iter(bot.users), len(bot.users))),
+        'channels': (channels, estimate(itertools.chain.from_iterable(g._channels.values() for g in guilds), channels)),
+        'roles': (roles, estimate(itertools.chain.from_iterable(g._roles.values() for g in guilds), roles)),
+        'voice_states': (voice_states, estimate(
+            itertools.chain.from_iterable(g._voice_states.values() for g in guilds), voice_states)),
+        'emojis': (emojis, estimate(itertools.chain(bot.emojis, bot.stickers), emojis)),
+        'messages': (len(messages), estimate(iter(messages), len(messages))),
+    }
+    return report
+
+
+def rss_bytes():
+    # Mémoire résidente actuelle (Linux), sinon pic de mémoire du processus
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+# Mode cluster : un lanceur répartit les shards entre N processus workers
+# (chacun exécute main.py avec AutoShardedBot) et relaie entre eux les
+# statistiques et les invalidations d'état partagé.
+#     python cluster.py
+
+CLUSTER_WORKERS = int(os.getenv('CLUSTER_WORKERS', '2'))
+CLUSTER_IPC_PORT = int(os.getenv('CLUSTER_IPC_PORT', '8790'))
+CLUSTER_STATS_INTERVAL = float(os.getenv('CLUSTER_STATS_INTERVAL', '10'))
+STATS_STALE_AFTER = 3 * CLUSTER_STATS_INTERVAL  # worker bloqué : plus de statistiques depuis ce délai
+PORT = int(os.getenv('PORT', '8080'))
+WORKER_PORT_BASE = int(os.getenv('CLUSTER_WORKER_PORT_BASE', str(PORT + 1)))
+RESTART_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+
+def shard_ranges(shard_count, workers):
+    # Plages contiguës : [0, 1, 2], [3, 4, 5], ...
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def _send(writer, message):
+    writer.write(json.dumps(message).encode() + b'\n')
+    await writer.drain()
+
+
+class ClusterClient:
+    # Côté worker : envoie ses statistiques au lanceur, reçoit les invalidations
+
+    def __init__(self, bot, address, on_invalidate=None):
+        self.bot = bot
+        self.host, port = address.rsplit(':', 1)
+        self.port = int(port)
+        self.cluster_id = int(os.getenv('CLUSTER_ID', '0'))
+        self.on_invalidate = on_invalidate
+        self._writer = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stats(self):
+        latency = self.bot.latency
+        return {
+            'type': 'stats',
+            'cluster_id': self.cluster_id,
+            'shard_ids': list(getattr(self.bot, 'shard_ids', None) or []),
+            'ready': self.bot.is_ready(),
+            'latency_ms': None if latency != latency or latency == float('inf') else round(latency * 1000, 1),
+            'guilds': len(self.bot.guilds),
+            'voice_clients': len(self.bot.voice_clients),
+        }
+
+    async def invalidate(self, kind, key):
+        # Prévient les autres workers qu'une donnée partagée a changé
+        if self._writer is not None:
+            try:
+                await _send(self._writer, {'type': 'invalidate', 'kind': kind, 'key': key})
+            except (ConnectionError, RuntimeError) as e:
+                logger.warning("Invalidation non transmise : %s", e)
+
+    async def _run(self):
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                reporter = asyncio.create_task(self._report())
+                try:
+                    while line := await reader.readline():
+                        message = json.loads(line)
+                        if message.get('type') == 'invalidate' and self.on_invalidate:
+                            self.on_invalidate(message['kind'], message['key'])
+                finally:
+                    reporter.cancel()
+                    self._writer = None
+            except (ConnectionError, OSError) as e:
+                logger.warning("Connexion au lanceur impossible : %s", e)
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def _report(self):
+        while True:
+            await _send(self._writer, self.stats())
+            await asyncio.sleep(CLUSTER_STATS_INTERVAL)
+
+
+class ClusterLauncher:
+    def __init__(self, token, workers=CLUSTER_WORKERS):
+        self.token = token
+        self.workers = workers
+        self.shard_count = int(os.getenv('SHARD_COUNT', '0'))
+        self.processes = {}
+        self.ranges = []
+        self.stats = {}  # cluster_id -> dernières statistiques
+        self._clients = set()
+        self._stopping = False
+
+    async def recommended_shards(self):
+        from aiohttp import ClientSession
+        async with ClientSession() as session:
+            async with session.get('https://discord.com/api/v10/gateway/bot',
+                                   headers={'Authorization': f'Bot {self.token}'}) as response:
+                response.raise_for_status()
+                return (await response.json())['shards']
+
+    async def _handle_worker(self, reader, writer):
+        self._clients.add(writer)
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message.get('type') == 'stats':
+                    message['updated'] = time.time()
+                    self.stats[message['cluster_id']] = message
+                elif message.get('type') == 'invalidate':
+                    for client in list(self._clients):
+                        if client is not writer:
+                            try:
+                                await _send(client, message)
+                            except ConnectionError:
+                                self._clients.discard(client)
+        except ConnectionError:
+            pass  # worker arrêté : _supervise s'occupe du redémarrage
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _supervise(self, cluster_id, shard_ids):
+        env = dict(os.environ,
+                   SHARD_COUNT=str(self.shard_count),
+                   SHARD_IDS=','.join(map(str, shard_ids)),
+                   CLUSTER_ID=str(cluster_id),
+                   CLUSTER_IPC=f'127.0.0.1:{CLUSTER_IPC_PORT}',
+                   PORT=str(WORKER_PORT_BASE + cluster_id))
+        main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+        while not self._stopping:
+            logger.info("Démarrage du worker %s (shards %s)", cluster_id, shard_ids)
+            process = self.processes[cluster_id] = await asyncio.create_subprocess_exec(
+                sys.executable, main_path, env=env)
+            code = await process.wait()
+            self.stats.pop(cluster_id, None)
+            if self._stopping:
+                break
+            logger.error("Worker %s arrêté (code %s), redémarrage dans %ss", cluster_id, code, RESTART_DELAY)
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def health(self, request):
+        from aiohttp import web
+        now = time.time()
+        workers = []
+        for i in range(len(self.ranges)):
+            worker = self.stats.get(i, {'cluster_id': i, 'ready': False})
+            if 'updated' in worker and now - worker['updated'] > STATS_STALE_AFTER:
+                # Processus vivant mais muet (boucle bloquée) : son dernier "ready" ne vaut plus
+                worker = dict(worker, ready=False, stale=True)
+            workers.append(worker)
+        ready = bool(workers) and all(worker['ready'] for worker in workers)
+        status = {
+            'status': 'ok' if ready else 'starting',
+            'ready': ready,
+            'shard_count': self.shard_count,
+            'guilds': sum(worker.get('guilds', 0) for worker in workers),
+            'voice_clients': sum(worker.get('voice_clients', 0) for worker in workers),
+            'workers': workers,
+        }
+        return web.json_response(status, status=200 if ready else 503)
+
+    def stop(self):
+        self._stopping = True
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.terminate()
+
+    async def run(self):
+        from aiohttp import web
+        if not self.shard_count:
+            self.shard_count = await self.recommended_shards()
+        self.ranges = shard_ranges(self.shard_count, self.workers)
+        logger.info("%s shard(s) répartis sur %s worker(s)", self.shard_count, len(self.ranges))
+
+        server = await asyncio.start_server(self._handle_worker, '127.0.0.1', CLUSTER_IPC_PORT)
+        app = web.Application()
+        app.router.add_get('/', lambda request: web.Response(text="Cluster en ligne !"))
+        app.router.add_get('/health', self.health)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', PORT).start()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except NotImplementedError:
+                pass
+        try:
+            await asyncio.gather(*(self._supervise(i, shards) for i, shards in enumerate(self.ranges)))
+        finally:
+            server.close()
+            await runner.cleanup()
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from logging_setup import setup_logging
+
+    setup_logging()
+    load_dotenv()
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        logger.error("DISCORD_TOKEN non trouvé dans les variables d'environnement")
+        sys.exit(1)
+    asyncio.run(ClusterLauncher(token).run())
@@ -0,0 +1,64 @@
+import string
+
+# Variables utilisables dans les réponses des commandes personnalisées, ex :
+#     !addcmd salut Bonjour {mention}, bienvenue sur {server} !
+PLACEHOLDERS = {
+    'user': lambda message, args: message.author.display_name,
+    'mention': lambda message, args: message.author.mention,
+    'server': lambda message, args: message.guild.name if message.guild else '',
+    'channel': lambda message, args: getattr(message.channel, 'mention', ''),
+    'args': lambda message, args: args,
+}
+
+_formatter = string.Formatter()
+
+
+class Template:
+    # Réponse découpée une seule fois en segments (texte fixe, variable)
+
+    def __init__(self, text):
+        self.text = text
+        self.segments = []
+        try:
+            for literal, field, _, _ in _formatter.parse(text):
+                if literal:
+                    self.segments.append((literal, None))
+                if field is not None:
+                    if field in PLACEHOLDERS:
+                        self.segments.append((None, PLACEHOLDERS[field]))
+                    else:
+                        # Variable inconnue : on garde le texte tel quel
+                        self.segments.append(('{' + field + '}', None))
+        except ValueError:
+            # Accolades non appariées : réponse littérale
+            self.segments = [(text, None)]
+        self.static = all(func is None for _, func in self.segments)
+        if self.static:
+            self.text = ''.join(literal for literal, _ in self.segments)
+
+    def render(self, message, args=''):
+        if self.static:
+            return self.text
+        return ''.join(literal if func is None else str(func(message, args)) for literal, func in self.segments)
+
+
+def parse_invocation(content, prefix):
+    # "!nom arguments" -> ("nom", "arguments"), ou None si ce n'est pas une commande
+    if not content.startswith(prefix):
+        return None
+    parts = content[len(prefix):].split(maxsplit=1)
+    if not parts or content[len(prefix):len(prefix) + 1].isspace():
+        return None
+    return parts[0].lower(), parts[1] if len(parts) > 1 else ''
+
+
+def get_template(guild, name):
+    # Modèles compilés gardés avec les données du serveur, recompilés si la réponse change
+    response = guild['custom_cmds'].get(name)
+    if response is None:
+        return None
+    templates = guild.setdefault('templates', {})
+    template = templates.get(name)
+    if template is None or template[0] != response:
+        template = templates[name] = (response, Template(response))
+    return template[1]
@@ -0,0 +1,278 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+
+from ratelimit import admission
+
+logger = logging.getLogger(__name__)
+
+# Configuration du pool d'extraction (variables d'environnement)
+EXTRACT_MODE = os.getenv('EXTRACT_MODE', 'thread')  # 'thread' ou 'process'
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', '4'))
+EXTRACT_TIMEOUT = float(os.getenv('EXTRACT_TIMEOUT', '30'))
+EXTRACT_MAX_PENDING = int(os.getenv('EXTRACT_MAX_PENDING', '50'))
+
+# Champs conservés de l'info yt-dlp (résultat léger, sérialisable entre processus)
+KEPT_FIELDS = ('url', 'title', 'duration', 'webpage_url', 'id', 'acodec', 'ext', 'abr')
+FLAT_FIELDS = ('url', 'title', 'duration')
+
+
+# Options yt-dlp avec fallback et timeout
+def ydl_options():
+    return {
+        # Opus/WebM en priorité : le flux peut être envoyé à Discord sans ré-encodage
+        'format': 'bestaudio[acodec=opus]/bestaudio/best',
+        'noplaylist': True,
+        'quiet': True,
+        'no_warnings': True,
+        'default_search': 'auto',
+        'source_address': '0.0.0.0',
+        'cookiefile': 'cookies.txt' if os.path.exists('cookies.txt') else None,
+        'http_headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        },
+        'socket_timeout': 10,
+        'ignoreerrors': True,
+        'retry_max': 3,
+        'sleep_interval': 5,
+        'max_sleep_interval': 10,
+    }
+
+
+# Playlists et recherches : extraction « à plat » (identifiants et titres, sans URL de flux)
+def flat_options():
+    return dict(ydl_options(), extract_flat='in_playlist', noplaylist=False)
+
+
+class ExtractionBusy(Exception):
+    """File d'attente d'extraction pleine."""
+
+
+class ExtractionCancelled(Exception):
+    """Extraction annulée (timeout ou annulation de la commande)."""
+
+
+_ydl_class = None
+
+
+def _cancellable_ydl_class():
+    # Import paresseux : yt-dlp n'est chargé que dans les workers
+    global _ydl_class
+    if _ydl_class is None:
+        import yt_dlp
+
+        class Cancelled(ExtractionCancelled, yt_dlp.utils.DownloadCancelled):
+            # Sous-classe de DownloadCancelled : relancée par yt-dlp même avec ignoreerrors
+            msg = "Extraction annulée"
+
+        class CancellableYoutubeDL(yt_dlp.YoutubeDL):
+            def __init__(self, params, cancel_event=None):
+                super().__init__(params)
+                self._cancel_event = cancel_event
+
+            def urlopen(self, req):
+                # Point d'annulation coopératif avant chaque requête HTTP
+                if self._cancel_event is not None and self._cancel_event.is_set():
+                    raise Cancelled()
+                return super().urlopen(req)
+
+        _ydl_class = CancellableYoutubeDL
+    return _ydl_class
+
+
+def _preload():
+    start = time.perf_counter()
+    _cancellable_ydl_class()
+    return time.perf_counter() - start
+
+
+_worker_state = threading.local()
+
+
+def _get_ydl(ydl_opts):
+    # Une instance YoutubeDL par worker et par jeu d'options (normal / à plat),
+    # réutilisée : évite de recréer l'instance et de relire cookies.txt à chaque extraction
+    opts_key = json.dumps(ydl_opts, sort_keys=True, default=str)
+    instances = getattr(_worker_state, 'instances', None)
+    if instances is None:
+        instances = _worker_state.instances = {}
+    ydl = instances.get(opts_key)
+    if ydl is None:
+        if len(instances) >= 4:
+            for old in instances.values():
+                old.close()
+            instances.clear()
+        ydl = instances[opts_key] = _cancellable_ydl_class()(ydl_opts)
+    return ydl
+
+
+def _extract_info(url, ydl_opts, cancel_event=None):
+    # Exécuté dans un worker (thread ou processus), jamais sur la boucle asyncio
+    ydl = _get_ydl(ydl_opts)
+    ydl._cancel_event = cancel_event
+    try:
+        info = ydl.extract_info(url, download=False)
+    finally:
+        ydl._cancel_event = None
+    if not info:
+        return None
+    if 'entries' in info:
+        info = next((entry for entry in info['entries'] if entry), None)
+        if not info:
+            return None
+    return {field: info.get(field) for field in KEPT_FIELDS}
+
+
+def _extract_flat(url, ydl_opts, cancel_event=None, start=1, end=None):
+    # Entrées start..end d'une playlist ou d'une recherche : seules les pages
+    # nécessaires sont téléchargées, les URLs de flux sont résolues plus tard
+    ydl = _get_ydl(ydl_opts)
+    ydl._cancel_event = cancel_event
+    ydl.params['playlist_items'] = f'{start}-{end}' if end else f'{start}-'
+    try:
+        info = ydl.extract_info(url, download=False)
+    finally:
+        ydl._cancel_event = None
+        ydl.params.pop('playlist_items', None)
+    if not info:
+        return None
+    if 'entries' not in info:
+        # Pas une playlist : une seule vidéo, déjà résolue
+        return {'title': info.get('title'), 'entries': None, 'info': {field: info.get(field) for field in KEPT_FIELDS}}
+    entries = []
+    for entry in info['entries']:
+        if not entry:
+            continue
+        if not entry.get('url') and entry.get('id'):
+            entry['url'] = f"https://www.youtube.com/watch?v={entry['id']}"
+        if entry.get('url'):
+            entries.append({field: entry.get(field) for field in FLAT_FIELDS})
+    return {'title': info.get('title'), 'entries': entries, 'info': None}
+
+
+class ExtractionPool:
+    def __init__(self, mode=EXTRACT_MODE, workers=EXTRACT_WORKERS,
+                 timeout=EXTRACT_TIMEOUT, max_pending=EXTRACT_MAX_PENDING):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Mode d'extraction inconnu : {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = None
+        # Métriques
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.mode == 'process':
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='ytdl')
+            logger.info("Pool d'extraction démarré (%s, %s workers)", self.mode, self.workers)
+        return self._executor
+
+    @property
+    def queue_depth(self):
+        return self.pending + self.running
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'pending': self.pending,
+            'running': self.running,
+            'queue_depth': self.queue_depth,
+            'completed': self.completed,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+        }
+
+    def _release_slot(self, _future=None):
+        self.running -= 1
+        self._slots.release()
+        admission.release()
+
+    async def extract(self, url, ydl_opts=None, timeout=None):
+        return await self._run('extract', _extract_info, url, ydl_opts or ydl_options(), timeout)
+
+    async def extract_flat(self, url, start=1, end=None, timeout=None):
+        return await self._run('playlist', _extract_flat, url, flat_options(), timeout, start, end)
+
+    async def _run(self, kind, func, url, ydl_opts, timeout, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        if self.pending >= self.max_pending or admission.full():
+            self.rejected += 1
+            raise ExtractionBusy()
+
+        # Admission globale (coût croissant), puis place dans le pool
+        self.pending += 1
+        try:
+            await admission.acquire(kind)
+            try:
+                await self._slots.acquire()
+            except BaseException:
+                admission.release()
+                raise
+        finally:
+            self.pending -= 1
+        self.running += 1
+
+        loop = asyncio.get_running_loop()
+        cancel_event = threading.Event() if self.mode == 'thread' else None
+        try:
+            future = self._get_executor().submit(func, url, ydl_opts, cancel_event, *args)
+        except Exception:
+            self._release_slot()
+            raise
+        # Le slot n'est libéré que lorsque le worker a réellement fini,
+        # pour que la limite de concurrence reflète le travail en cours.
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release_slot, f))
+
+        try:
+            info = await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if cancel_event is not None:
+                cancel_event.set()
+            logger.error("Timeout d'extraction pour %s (file : %s)", url, self.queue_depth)
+            raise
+        except asyncio.CancelledError:
+            if cancel_event is not None:
+                cancel_event.set()
+            raise
+        except Exception:
+            self.failures += 1
+            raise
+        self.completed += 1
+        return info
+
+    async def preload(self):
+        # Importe yt-dlp dans les workers avant la première extraction
+        # (plusieurs centaines de modules : à faire une fois connecté)
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        count = self.workers if self.mode == 'process' else 1
+        durations = await asyncio.gather(*(loop.run_in_executor(executor, _preload) for _ in range(count)))
+        logger.info("yt-dlp préchargé en %.0f ms", max(durations) * 1000)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+extraction_pool = ExtractionPool()
@@ -0,0 +1,93 @@
+import asyncio
+import collections
+import os
+
+import metrics
+
+# Plafond global des processus ffmpeg/ffprobe (tous serveurs confondus, lectures,
+# analyses et mises en cache) et de leur coût CPU : un remuxage Opus ne coûte
+# presque rien, un transcodage bien plus.
+FFMPEG_MAX_PROCESSES = int(os.getenv('FFMPEG_MAX_PROCESSES', '16'))
+FFMPEG_CPU_BUDGET = int(os.getenv('FFMPEG_CPU_BUDGET', str(4 * (os.cpu_count() or 1))))
+FFMPEG_QUEUE_TIMEOUT = float(os.getenv('FFMPEG_QUEUE_TIMEOUT', '30'))
+
+# Poids CPU par type de lecture
+WEIGHT_COPY = 1  # passthrough Opus
+WEIGHT_TRANSCODE = 4  # décodage + encodage Opus
+WEIGHT_DEGRADED = 2  # encodage Opus allégé (débit et complexité réduits)
+WEIGHT_ANALYSIS = 2  # décodage seul (analyse de sonie, voir loudness.py)
+WEIGHT_PROBE = 1  # ffprobe avant une lecture de codec inconnu
+
+
+degraded = metrics.Counter('bot_ffmpeg_degraded_total', 'Lectures transcodées en qualité réduite')
+rejected = metrics.Counter('bot_ffmpeg_rejected_total', 'Lectures refusées faute de place')
+
+
+class FFmpegBusy(Exception):
+    """Trop de lectures en cours sur l'ensemble des serveurs."""
+
+
+class FFmpegAdmission:
+    # Les demandes sont servies dans l'ordre d'arrivée : une lecture en attente
+    # n'est pas doublée indéfiniment par des lectures moins coûteuses
+
+    def __init__(self, max_processes=FFMPEG_MAX_PROCESSES, cpu_budget=FFMPEG_CPU_BUDGET):
+        self.max_processes = max_processes
+        self.cpu_budget = cpu_budget
+        self.processes = 0
+        self.cpu_used = 0
+        self._waiters = collections.deque()  # (poids, future)
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def _fits(self, weight):
+        return self.processes < self.max_processes and self.cpu_used + weight <= self.cpu_budget
+
+    def try_acquire(self, weight):
+        if self._waiters or not self._fits(weight):
+            return False
+        self.processes += 1
+        self.cpu_used += weight
+        return True
+
+    async def acquire(self, weight, timeout=FFMPEG_QUEUE_TIMEOUT):
+        if self.try_acquire(weight):
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = (weight, future)
+        self._waiters.append(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Place attribuée au même moment : on la rend
+                self.release(weight)
+            else:
+                future.cancel()
+                self._waiters.remove(entry)
+            if isinstance(e, asyncio.TimeoutError):
+                rejected.inc()
+                raise FFmpegBusy() from None
+            raise
+
+    def release(self, weight):
+        self.processes -= 1
+        self.cpu_used -= weight
+        while self._waiters:
+            weight, future = self._waiters[0]
+            if not self._fits(weight):
+                break
+            self._waiters.popleft()
+            if not future.done():
+                self.processes += 1
+                self.cpu_used += weight
+                future.set_result(None)
+
+
+ffmpeg_admission = FFmpegAdmission()
+
+metrics.Gauge('bot_ffmpeg_processes', 'Processus ffmpeg de lecture en cours', lambda: ffmpeg_admission.processes)
+metrics.Gauge('bot_ffmpeg_cpu_used', 'Budget CPU ffmpeg utilisé', lambda: ffmpeg_admission.cpu_used)
+metrics.Gauge('bot_ffmpeg_waiting', 'Lectures en attente de ffmpeg', lambda: ffmpeg_admission.waiting)
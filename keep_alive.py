@@ -1,21 +1,55 @@
-from flask import Flask
-from threading import Thread
+from aiohttp import web
 import logging
+import math
+import os
 
-app = Flask('')
-logging.getLogger('werkzeug').setLevel(logging.ERROR)  # Réduit les logs verbeux
+import metrics
 
-@app.route('/')
-def home():
-    return "Bot en ligne !"
+logger = logging.getLogger(__name__)
 
-@app.route('/health')
-def health():
-    return "OK", 200
+PORT = int(os.getenv('PORT', '8080'))
 
-def run():
-    app.run(host='0.0.0.0', port=8080, debug=False)
+# Serveur HTTP dans la boucle asyncio du bot (plus de thread Flask séparé)
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+
+async def home(request):
+    return web.Response(text="Bot en ligne !")
+
+
+def _ms(latency):
+    return None if math.isnan(latency) or math.isinf(latency) else round(latency * 1000, 1)
+
+
+async def health(request):
+    bot = request.app['bot']
+    ready = bot.is_ready()
+    latency = bot.latency
+    status = {
+        'status': 'ok' if ready else 'starting',
+        'ready': ready,
+        'latency_ms': _ms(latency),
+        'guilds': len(bot.guilds),
+        'voice_clients': len(bot.voice_clients),
+    }
+    if hasattr(bot, 'latencies'):
+        # AutoShardedBot : latence de chaque shard géré par ce processus
+        status['shards'] = {str(shard_id): _ms(shard_latency) for shard_id, shard_latency in bot.latencies}
+    return web.json_response(status, status=200 if ready else 503)
+
+
+async def metrics_handler(request):
+    return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+
+async def keep_alive(bot, host='0.0.0.0', port=PORT):
+    app = web.Application()
+    app['bot'] = bot
+    app.router.add_get('/', home)
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("Serveur HTTP démarré sur le port %s", port)
+    return runner
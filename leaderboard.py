@@ -0,0 +1,122 @@
+import asyncio
+import collections
+import os
+import time
+
+import discord
+from sortedcontainers import SortedList
+
+from xp import level_for_xp
+
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_EMBED_TTL = float(os.getenv('LEADERBOARD_EMBED_TTL', '30'))
+LEADERBOARD_MAX_GUILDS = int(os.getenv('LEADERBOARD_MAX_GUILDS', '64'))
+
+
+class RankIndex:
+    # Classement d'un serveur, trié en permanence : rang et pages en O(log n)
+
+    def __init__(self, members=()):
+        self._xp = dict(members)  # user_id -> xp
+        self._sorted = SortedList((-xp, user_id) for user_id, xp in self._xp.items())
+
+    def __len__(self):
+        return len(self._xp)
+
+    def update(self, user_id, xp):
+        old = self._xp.get(user_id)
+        if old == xp:
+            return
+        if old is not None:
+            self._sorted.remove((-old, user_id))
+        self._xp[user_id] = xp
+        self._sorted.add((-xp, user_id))
+
+    def rank(self, user_id):
+        # Rang à partir de 1, ou None si le membre n'a pas d'XP
+        xp = self._xp.get(user_id)
+        if xp is None:
+            return None
+        return self._sorted.bisect_left((-xp, user_id)) + 1
+
+    def page(self, start, count):
+        return [(user_id, -neg_xp) for neg_xp, user_id in self._sorted.islice(start, start + count)]
+
+
+class Leaderboard:
+    # Index par serveur chargés à la demande (LRU borné), tenus à jour par le moteur d'XP
+
+    def __init__(self, backend, xp_engine, max_guilds=LEADERBOARD_MAX_GUILDS):
+        self.backend = backend
+        self.xp_engine = xp_engine
+        self.max_guilds = max_guilds
+        self._indexes = collections.OrderedDict()
+        self._loading = {}  # guild_id -> (tâche de chargement, gains d'XP reçus pendant le chargement)
+        self._embeds = {}  # (guild_id, page) -> (date, embed)
+        xp_engine.listeners.append(self.on_xp)
+
+    def _build(self, guild_id):
+        # Exécuté hors de la boucle : lecture de tous les membres et tri
+        return RankIndex((user_id, xp) for user_id, xp, _ in self.backend.guild_members(guild_id))
+
+    async def _load(self, guild_id, updates):
+        # L'XP encore en mémoire doit être envoyée au stockage avant le chargement
+        self.xp_engine.flush()
+        index = await asyncio.get_running_loop().run_in_executor(None, self._build, guild_id)
+        for user_id, xp in updates.items():
+            index.update(user_id, xp)
+        self._indexes[guild_id] = index
+        while len(self._indexes) > self.max_guilds:
+            evicted, _ = self._indexes.popitem(last=False)
+            self._drop_embeds(evicted)
+        return index
+
+    async def index(self, guild_id):
+        index = self._indexes.get(guild_id)
+        if index is not None:
+            self._indexes.move_to_end(guild_id)
+            return index
+        # Un seul chargement par serveur, partagé entre les commandes simultanées
+        loading = self._loading.get(guild_id)
+        if loading is None:
+            updates = {}
+            task = asyncio.create_task(self._load(guild_id, updates))
+            loading = self._loading[guild_id] = (task, updates)
+            task.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+        return await asyncio.shield(loading[0])
+
+    def on_xp(self, guild_id, user_id, xp):
+        index = self._indexes.get(guild_id)
+        if index is not None:
+            index.update(user_id, xp)
+        elif guild_id in self._loading:
+            self._loading[guild_id][1][user_id] = xp
+
+    def _drop_embeds(self, guild_id):
+        for key in [key for key in self._embeds if key[0] == guild_id]:
+            del self._embeds[key]
+
+    async def rank(self, guild_id, user_id):
+        index = await self.index(guild_id)
+        return index.rank(user_id), len(index)
+
+    async def page_count(self, guild_id):
+        return max(1, -(-len(await self.index(guild_id)) // LEADERBOARD_PAGE_SIZE))
+
+    async def embed(self, guild_id, page, guild_name):
+        # Embeds mis en cache quelques secondes : un spam de !leaderboard ne recalcule rien
+        cached = self._embeds.get((guild_id, page))
+        now = time.monotonic()
+        if cached and now - cached[0] < LEADERBOARD_EMBED_TTL:
+            return cached[1]
+        index = await self.index(guild_id)
+        start = (page - 1) * LEADERBOARD_PAGE_SIZE
+        lines = [f"**#{start + i}** <@{user_id}> — niveau {level_for_xp(xp)} ({xp} XP)"
+                 for i, (user_id, xp) in enumerate(index.page(start, LEADERBOARD_PAGE_SIZE), start=1)]
+        embed = discord.Embed(title=f"Classement de {guild_name}", color=0x00ff00,
+                              description="\n".join(lines) or "Aucun membre classé.")
+        embed.set_footer(text=f"Page {page}/{await self.page_count(guild_id)} · {len(index)} membres")
+        if len(self._embeds) > self.max_guilds * 4:
+            self._embeds.clear()
+        self._embeds[(guild_id, page)] = (now, embed)
+        return embed
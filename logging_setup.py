@@ -0,0 +1,88 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+# Configuration des logs (variables d'environnement)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' ou 'json'
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'discord=WARNING')  # ex : "discord=WARNING,music=DEBUG"
+LOG_SAMPLE = os.getenv('LOG_SAMPLE', 'messages=0.01')  # ex : "messages=0.01" (1 % des logs conservés)
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+
+
+def _parse_mapping(value):
+    mapping = {}
+    for item in value.split(','):
+        if '=' in item:
+            name, setting = item.split('=', 1)
+            mapping[name.strip()] = setting.strip()
+    return mapping
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    # Ne garde qu'une fraction des logs des sous-systèmes très bavards
+    # (les avertissements et erreurs passent toujours)
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # Le message n'est pas formaté sur le thread appelant : le thread
+    # d'écriture s'en charge (formatage %-style paresseux)
+
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+
+
+def setup_logging():
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter({name: float(rate) for name, rate in _parse_mapping(LOG_SAMPLE).items()}))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_mapping(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
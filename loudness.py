@@ -0,0 +1,142 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import re
+import subprocess
+
+import metrics
+from ffmpeg_admission import ffmpeg_admission, WEIGHT_ANALYSIS
+from media_cache import media_cache, track_key
+
+logger = logging.getLogger(__name__)
+
+# Normalisation du volume précalculée : la sonie intégrée (EBU R128) d'une
+# piste est mesurée une seule fois en arrière-plan, le gain obtenu est gardé
+# avec ses métadonnées, et les lectures suivantes n'appliquent qu'un gain
+# constant au lieu d'un filtre loudnorm en temps réel. Par défaut, seules les
+# lectures déjà décodées (transcodage, mode PCM) reçoivent le gain : le
+# passthrough Opus reste sans décodage.
+LOUDNESS_ENABLED = os.getenv('LOUDNESS', '1') == '1'
+LOUDNESS_PASSTHROUGH = os.getenv('LOUDNESS_PASSTHROUGH', '0') == '1'  # 1 : transcode aussi l'Opus pour appliquer le gain
+LOUDNESS_TARGET = float(os.getenv('LOUDNESS_TARGET', '-16'))  # LUFS
+LOUDNESS_MAX_GAIN = float(os.getenv('LOUDNESS_MAX_GAIN', '12'))  # dB, dans les deux sens
+LOUDNESS_MIN_GAIN = float(os.getenv('LOUDNESS_MIN_GAIN', '1'))  # dB : en dessous, piste jouée telle quelle
+LOUDNESS_WORKERS = int(os.getenv('LOUDNESS_WORKERS', '1'))
+LOUDNESS_MAX_PENDING = int(os.getenv('LOUDNESS_MAX_PENDING', '20'))
+LOUDNESS_MAX_SECONDS = int(os.getenv('LOUDNESS_MAX_SECONDS', '600'))  # durée analysée au plus
+ANALYSIS_TIMEOUT = 300
+
+analyses = metrics.Counter('bot_loudness_analyses_total', 'Analyses de sonie', ('status',))
+
+_INTEGRATED = re.compile(r'I:\s+(-?[\d.]+) LUFS')
+
+
+def _lower_priority():
+    # Workers d'analyse moins prioritaires que la lecture
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+
+
+def _measure(ffmpeg_path, url, max_seconds):
+    # Exécuté dans un processus du pool : décode la piste et renvoie sa sonie intégrée (LUFS)
+    args = [ffmpeg_path, '-nostdin', '-hide_banner', '-nostats',
+            '-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5',
+            '-t', str(max_seconds), '-i', url, '-vn',
+            '-af', 'ebur128=framelog=quiet', '-f', 'null', '-']
+    result = subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, timeout=ANALYSIS_TIMEOUT)
+    stderr = result.stderr.decode(errors='replace')
+    if result.returncode != 0:
+        raise RuntimeError(stderr.strip().splitlines()[-1] if stderr.strip() else f"code {result.returncode}")
+    # Le résumé final vient après les éventuelles valeurs intermédiaires
+    matches = _INTEGRATED.findall(stderr)
+    if not matches:
+        raise RuntimeError("sonie intégrée absente de la sortie ffmpeg")
+    return float(matches[-1])
+
+
+def gain_for(info):
+    # Gain à appliquer (dB), ou None si inconnu ou négligeable
+    if not LOUDNESS_ENABLED or not info:
+        return None
+    gain = media_cache.gain(info)
+    if gain is None or abs(gain) < LOUDNESS_MIN_GAIN:
+        return None
+    return gain
+
+
+class LoudnessAnalyzer:
+    def __init__(self, workers=LOUDNESS_WORKERS, max_pending=LOUDNESS_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = {}  # clé -> tâche d'analyse
+        self._running = None  # une analyse par worker, les autres attendent sans réserver de budget
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_lower_priority)
+            logger.info("Pool d'analyse de sonie démarré (%s workers)", self.workers)
+        return self._executor
+
+    def schedule(self, info, passthrough=False):
+        # Appelé à chaque lecture : n'analyse que les pistes dont le gain est inconnu
+        # et servira (une piste lue en passthrough ne le recevrait pas)
+        if not LOUDNESS_ENABLED or not info or not info.get('url'):
+            return
+        if passthrough and not LOUDNESS_PASSTHROUGH:
+            return
+        if media_cache.gain(info) is not None:
+            return
+        key = track_key(info)
+        if key in self._pending:
+            return
+        if len(self._pending) >= self.max_pending:
+            analyses.inc('skipped')
+            return
+        task = asyncio.create_task(self._analyze(info))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    async def _analyze(self, info):
+        from music import FFMPEG_PATH
+        if self._running is None:
+            self._running = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        async with self._running:
+            # Le décodage compte dans le budget ffmpeg global ; sans place libre, la piste
+            # sera analysée à une prochaine lecture plutôt que de retarder les lectures
+            if not ffmpeg_admission.try_acquire(WEIGHT_ANALYSIS):
+                analyses.inc('skipped')
+                return
+            try:
+                loudness = await loop.run_in_executor(
+                    self._get_executor(), _measure, FFMPEG_PATH, info['url'], LOUDNESS_MAX_SECONDS)
+            except Exception as e:
+                analyses.inc('error')
+                logger.warning("Analyse de sonie échouée pour %s : %s", info.get('title'), e)
+                return
+            finally:
+                ffmpeg_admission.release(WEIGHT_ANALYSIS)
+        gain = max(-LOUDNESS_MAX_GAIN, min(LOUDNESS_MAX_GAIN, LOUDNESS_TARGET - loudness))
+        media_cache.set_gain(info, round(gain, 1))
+        analyses.inc('ok')
+        logger.info("Sonie de %s : %.1f LUFS, gain %+.1f dB", info.get('title'), loudness, gain)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+loudness_analyzer = LoudnessAnalyzer()
+
+metrics.Gauge('bot_loudness_pending', 'Analyses de sonie en cours', lambda: loudness_analyzer.pending)
@@ -1,79 +1,304 @@
+import time
+STARTED = time.perf_counter()  # référence du rapport de démarrage
+
 import discord
 from discord.ext import commands
-import json
 import os
 import asyncio
-import random
-import yt_dlp
+import signal
 from dotenv import load_dotenv
+from logging_setup import setup_logging
 from keep_alive import keep_alive
+from storage import open_storage, GuildCache, LEGACY_GUILD_ID
+from word_filter import get_filter
+from xp import XPEngine
+from leaderboard import Leaderboard
+from custom_cmds import parse_invocation, get_template
+from purge import PurgeJob, PurgeFilter, PURGE_MAX, jobs as purge_jobs
+from mute import MuteScheduler, ensure_mute_overwrites, get_mute_role, parse_duration, MUTE_ROLE_NAME
+import metrics
+from monitoring import current_command, command_errors, command_api_seconds, instrument_http, lag_monitor, loop_lag, loop_blocked
+from cluster import ClusterClient
+from cache_stats import cache_report, rss_bytes
+from ratelimit import limiter, cost_class, format_retry
 import logging
 
-# Configurer les logs
-logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+# Durées du démarrage (secondes depuis le lancement), rapportées au premier on_ready
+startup_timings = {'imports': time.perf_counter() - STARTED}
+
+# Configurer les logs (écriture en arrière-plan, voir logging_setup.py)
+setup_logging()
 logger = logging.getLogger(__name__)
+message_logger = logging.getLogger('messages')  # très bavard : échantillonné via LOG_SAMPLE
 
 # Charger les variables d'environnement
 load_dotenv()
-TOKEN = os.getenv('DISCORD_TOKEN')
+TOKEN = os.getenv('DISCORD_TOKEN') or os.getenv('TOKEN')  # TOKEN : nom utilisé par l'ancien bot.py
 if not TOKEN:
     logger.error("DISCORD_TOKEN non trouvé dans les variables d'environnement")
     exit(1)
 
-# Intents ultra-minimaux pour réduire la charge
-intents = discord.Intents.default()
+# Configuration de la gateway et des caches (variables d'environnement)
+INTENT_MEMBERS = os.getenv('INTENT_MEMBERS', '0') == '1'  # intent privilégié, inutile aux commandes actuelles
+INTENT_PRESENCES = os.getenv('INTENT_PRESENCES', '0') == '1'
+MAX_MESSAGES = int(os.getenv('MAX_MESSAGES', '0'))  # 0 : pas de cache de messages
+MEMBER_CACHE = os.getenv('MEMBER_CACHE', 'voice')  # 'none', 'voice' (membres en vocal) ou 'all'
+CHUNK_GUILDS = os.getenv('CHUNK_GUILDS', '0') == '1'
+
+# Intents explicites : seuls les événements utilisés par le bot
+intents = discord.Intents.none()
+intents.guilds = True
+intents.guild_messages = True
+intents.dm_messages = True
 intents.message_content = True
-intents.members = False  # Désactiver si non nécessaire
 intents.voice_states = True
-intents.presences = False
-intents.guilds = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+intents.members = INTENT_MEMBERS
+intents.presences = INTENT_PRESENCES
+
+if MEMBER_CACHE == 'none':
+    member_cache_flags = discord.MemberCacheFlags.none()
+elif MEMBER_CACHE == 'voice':
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+else:
+    member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+
+bot_options = dict(
+    command_prefix='!',
+    intents=intents,
+    max_messages=MAX_MESSAGES or None,
+    member_cache_flags=member_cache_flags,
+    chunk_guilds_at_startup=CHUNK_GUILDS,
+)
+
+# Sharding : SHARD_COUNT/SHARD_IDS sont fixés par cluster.py, AUTO_SHARD=1 laisse Discord choisir
+SHARD_COUNT = os.getenv('SHARD_COUNT')
+SHARD_IDS = os.getenv('SHARD_IDS')
+if SHARD_COUNT or SHARD_IDS or os.getenv('AUTO_SHARD') == '1':
+    bot = commands.AutoShardedBot(
+        **bot_options,
+        shard_count=int(SHARD_COUNT) if SHARD_COUNT else None,
+        shard_ids=[int(i) for i in SHARD_IDS.split(',')] if SHARD_IDS else None,
+    )
+else:
+    bot = commands.Bot(**bot_options)
 
 # Supprime la commande help par défaut
 bot.remove_command('help')
 
 # Fichiers de stockage
-DATA_FILE = 'data.json'
-
-# Charger données avec gestion d'erreur
-def load_data():
+DATA_FILE = 'data.json'  # ancien format, migré automatiquement dans la base SQLite
+
+# Données par serveur, chargées à la demande (voir storage.py)
+storage = open_storage(legacy_json=DATA_FILE)
+guilds = GuildCache(storage)
+xp_engine = XPEngine(storage)
+leaderboard = Leaderboard(storage, xp_engine)
+mute_scheduler = MuteScheduler(bot, storage)
+
+def guild_id(ctx):
+    return ctx.guild.id if ctx.guild else LEGACY_GUILD_ID
+
+# Mode cluster : les autres workers rechargent les réglages modifiés ici
+def on_cluster_invalidate(kind, key):
+    if kind == 'guild':
+        guilds.invalidate(key)
+
+CLUSTER_IPC = os.getenv('CLUSTER_IPC')
+cluster_client = ClusterClient(bot, CLUSTER_IPC, on_invalidate=on_cluster_invalidate) if CLUSTER_IPC else None
+
+# Musique : extension chargée au premier !play ou en arrière-plan une fois connecté
+MUSIC_EXTENSION = 'music_cog'
+MUSIC_COMMANDS = ('play', 'pause', 'resume', 'stop', 'skip', 'queue')
+MUSIC_LAZY = os.getenv('MUSIC_LAZY', '1') == '1'  # 0 : chargée avant la connexion
+music_lock = asyncio.Lock()
+
+# Arrêt propre (SIGTERM) : plus de nouvelles commandes, attente de celles en cours
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', '10'))
+stopping = asyncio.Event()
+inflight = set()  # tâches exécutant une commande
+
+async def load_music():
+    async with music_lock:
+        if MUSIC_EXTENSION not in bot.extensions:
+            start = time.perf_counter()
+            await bot.load_extension(MUSIC_EXTENSION)
+            logger.info("Extension musique chargée en %.0f ms", (time.perf_counter() - start) * 1000)
+
+async def seed_legacy_guilds():
+    # Anciens réglages globaux de data.json : seulement pour les serveurs déjà
+    # rejoints lors de la migration (les nouveaux partent des valeurs par défaut)
+    joined = [(guild.id, guild.me.joined_at.timestamp() if guild.me and guild.me.joined_at else None)
+              for guild in bot.guilds]
+    seeded = await asyncio.get_running_loop().run_in_executor(None, storage.seed_legacy, joined)
+    for gid in seeded:
+        guilds.invalidate(gid)
+
+async def guild_changed(gid):
+    if cluster_client is not None:
+        storage.flush()  # écriture visible des autres processus avant l'invalidation
+        await cluster_client.invalidate('guild', gid)
+
+async def run_command(coro):
+    task = asyncio.current_task()
+    inflight.add(task)
     try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        logger.info("Nouveau fichier data.json créé")
-        return {'xp': {}, 'levels': {}, 'custom_cmds': {}, 'banned_words': [], 'url': 'https://example.com'}
-    except Exception as e:
-        logger.error(f"Erreur lors du chargement de {DATA_FILE}: {e}")
-        return {'xp': {}, 'levels': {}, 'custom_cmds': {}, 'banned_words': [], 'url': 'https://example.com'}
-
-data = load_data()
+        return await coro
+    finally:
+        inflight.discard(task)
 
-def save_data():
-    try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
-        logger.info("Données enregistrées dans data.json")
-    except Exception as e:
-        logger.error(f"Erreur lors de l'enregistrement de {DATA_FILE}: {e}")
+async def shutdown(sig):
+    if stopping.is_set():
+        return
+    stopping.set()
+    logger.info("Signal %s reçu, arrêt en cours", sig.name)
+    if inflight:
+        logger.info("Attente de %s commande(s) en cours", len(inflight))
+        _, pending = await asyncio.wait(set(inflight), timeout=SHUTDOWN_DRAIN_TIMEOUT)
+        if pending:
+            logger.warning("%s commande(s) interrompue(s) par l'arrêt", len(pending))
+    # Sessions musicales sauvegardées avant que close() ne déconnecte les salons vocaux
+    music = bot.get_cog('Music')
+    if music is not None:
+        music.save_sessions()
+    xp_engine.flush()
+    storage.flush()
+    if music is not None:
+        music.shutdown()
+    await bot.close()
+
+# Démarrage : tâches de fond et serveur HTTP (santé + métriques) dans la boucle du bot
+async def setup_hook():
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, lambda sig=sig: asyncio.create_task(shutdown(sig)))
+        except NotImplementedError:
+            pass
+    xp_engine.start()
+    mute_scheduler.start()
+    lag_monitor.start()
+    instrument_http(bot.http)
+    await keep_alive(bot)
+    if cluster_client is not None:
+        cluster_client.start()
+    if not MUSIC_LAZY:
+        await load_music()
+    startup_timings['setup'] = time.perf_counter() - STARTED
+
+bot.setup_hook = setup_hook
+
+# Métriques exportées sur /metrics
+metrics.Gauge('bot_ready', 'Bot connecté et prêt', lambda: int(bot.is_ready()))
+metrics.Gauge('bot_latency_seconds', 'Latence de la gateway Discord', lambda: bot.latency)
+metrics.Gauge('bot_guilds', 'Serveurs', lambda: len(bot.guilds))
+metrics.Gauge('bot_voice_clients', 'Connexions vocales actives', lambda: len(bot.voice_clients))
+metrics.Gauge('bot_startup_seconds', 'Durée des étapes du démarrage', lambda: startup_timings, ('phase',))
+metrics.Gauge('bot_process_rss_bytes', 'Mémoire résidente du processus', rss_bytes)
+metrics.Gauge('bot_cache_entries', 'Entrées des caches discord.py', lambda: {
+    name: entries for name, (entries, _) in cache_report(bot).items()}, ('cache',))
+metrics.Gauge('bot_cache_bytes', 'Mémoire estimée des caches discord.py', lambda: {
+    name: size for name, (_, size) in cache_report(bot).items()}, ('cache',))
+
+# Instrumentation de toutes les commandes : durée, temps passé dans l'API Discord
+@bot.before_invoke
+async def start_timer(ctx):
+    ctx.started_at = time.perf_counter()
+    ctx.api_state = [ctx.command.qualified_name, 0.0]
+    current_command.set(ctx.api_state)
+
+@bot.after_invoke
+async def record_timer(ctx):
+    name = ctx.command.qualified_name
+    metrics.commands_total.inc(name)
+    metrics.command_duration.observe(time.perf_counter() - ctx.started_at, name)
+    command_api_seconds.inc(name, amount=ctx.api_state[1])
+    current_command.set(None)
 
 # Event: Bot ready
 @bot.event
 async def on_ready():
-    logger.info(f'{bot.user} est connecté !')
+    logger.info('%s est connecté !', bot.user)
+    if 'ready' not in startup_timings:
+        startup_timings['ready'] = time.perf_counter() - STARTED
+        logger.info("Démarrage : imports %.0f ms, initialisation %.0f ms, connecté en %.0f ms",
+                    startup_timings['imports'] * 1000, startup_timings.get('setup', 0) * 1000,
+                    startup_timings['ready'] * 1000)
+        asyncio.create_task(load_music())
+        asyncio.create_task(seed_legacy_guilds())
     await bot.change_presence(activity=discord.Game(name="!help pour les commandes"))
-    logger.info(f"Commandes enregistrées : {[cmd.name for cmd in bot.commands]}")
-    logger.info(f"Commandes personnalisées chargées : {list(data['custom_cmds'].keys())}")
+    logger.info("Commandes enregistrées : %s", [cmd.name for cmd in bot.commands])
+    logger.info("Connecté à %s serveur(s), données chargées à la demande", len(bot.guilds))
+    logger.info("Mémoire : RSS %.1f Mio, caches %s", rss_bytes() / 1048576,
+                {name: entries for name, (entries, _) in cache_report(bot).items()})
+
+# Modération automatique : mots interdits (un seul passage sur le message)
+@bot.event
+async def on_message(message):
+    if message.author.bot:
+        return
+    message_logger.debug("Message vérifié (serveur %s, salon %s, %s caractères)",
+                         message.guild and message.guild.id, message.channel.id, len(message.content))
+    if isinstance(message.author, discord.Member) and not message.channel.permissions_for(message.author).manage_messages:
+        banned = get_filter(guilds.get(message.guild.id)).find(message.content)
+        if banned:
+            logger.info("Message de %s supprimé (mot interdit : %s)", message.author, banned)
+            try:
+                await message.delete()
+                await message.channel.send(f"{message.author.mention}, ton message contenait un mot interdit.", delete_after=5)
+            except discord.HTTPException as e:
+                logger.error("Erreur lors de la suppression du message : %s", e)
+            return
+    if message.guild:
+        new_level = xp_engine.award(message.guild.id, message.author.id)
+        if new_level is not None:
+            await message.channel.send(f"🎉 {message.author.mention} passe au niveau {new_level} !")
+
+    # Aiguillage rapide : les commandes personnalisées et inconnues sont traitées
+    # ici, sans passer par le framework ni par l'exception CommandNotFound
+    invocation = parse_invocation(message.content, bot.command_prefix)
+    if not invocation or stopping.is_set():
+        return
+    cmd_name, args = invocation
+    if cmd_name in MUSIC_COMMANDS and MUSIC_EXTENSION not in bot.extensions:
+        await load_music()
+    template = None
+    if cmd_name in bot.all_commands:
+        kind = cost_class(cmd_name)
+    else:
+        template = get_template(guilds.get(message.guild.id if message.guild else LEGACY_GUILD_ID), cmd_name)
+        kind = 'cheap' if template else 'unknown'
+
+    # Limitation de débit : refus silencieux, un seul avertissement par intervalle
+    # (jamais pour les commandes inconnues, dont la réponse coûterait un appel API)
+    retry_after = limiter.check(kind, message.author.id, message.guild and message.guild.id)
+    if retry_after:
+        if kind != 'unknown' and limiter.should_notify(message.author.id):
+            await message.channel.send(f"⏳ {message.author.mention}, doucement ! Réessaie dans {format_retry(retry_after)}.",
+                                       delete_after=10)
+        return
+
+    if cmd_name not in bot.all_commands:
+        if template:
+            # {args} vient de l'utilisateur : seule la mention de l'auteur ({mention}) notifie
+            await message.channel.send(template.render(message, args),
+                                       allowed_mentions=discord.AllowedMentions(everyone=False, roles=False,
+                                                                                users=[message.author]))
+        else:
+            await message.channel.send(f"Commande '{cmd_name}' non trouvée. Tapez !help pour la liste des commandes.")
+        return
+    # Le travail coûteux (extractions yt-dlp) passe par l'admission, unité par unité (voir ratelimit.py)
+    await run_command(bot.process_commands(message))
 
 # !help custom
 @bot.command(name='help')
 async def help_cmd(ctx):
     logger.info("Commande !help exécutée")
     embed = discord.Embed(title="Commandes du Bot", color=0x00ff00)
-    embed.add_field(name="Générales", value="!url\n!help", inline=False)
-    embed.add_field(name="Modération (Mods seulement)", value="!kick @user [raison]\n!ban @user [raison]\n!mute @user\n!unmute @user\n!clear <nombre>\n!addbanned <mot>", inline=False)
-    embed.add_field(name="Custom", value="!addcmd <nom> <réponse>\n!<nom> (exécute la custom)", inline=False)
-    embed.add_field(name="Musique", value="!play <URL YouTube>\n!pause\n!stop\n!skip", inline=False)
+    embed.add_field(name="Générales", value="!url\n!help\n!rank [@user]\n!leaderboard [page]", inline=False)
+    embed.add_field(name="Modération (Mods seulement)", value="!kick @user [raison]\n!ban @user [raison]\n!mute @user [durée]\n!unmute @user\n!clear <nombre> [@user] [bots] [fichiers] [regex:<motif>]\n!clearstop\n!addbanned <mot>\n!removebanned <mot>\n!stats", inline=False)
+    embed.add_field(name="Custom", value="!addcmd <nom> <réponse>\n!<nom> (exécute la custom)\nVariables : {user} {mention} {server} {channel} {args}", inline=False)
+    embed.add_field(name="Musique", value="!play <URL, playlist ou recherche>\n!pause\n!resume\n!stop\n!skip\n!queue", inline=False)
     embed.add_field(name="Admin Modo", value="!changeurl <nouvelle URL>", inline=False)
     await ctx.send(embed=embed)
 
@@ -81,7 +306,27 @@ async def help_cmd(ctx):
 @bot.command(name='url')
 async def show_url(ctx):
     logger.info("Commande !url exécutée")
-    await ctx.send(f"L'URL actuelle : {data['url']}")
+    await ctx.send(f"L'URL actuelle : {guilds.get(guild_id(ctx))['url']}")
+
+# Niveaux et classement
+@bot.command(name='rank')
+@commands.guild_only()
+async def rank(ctx, member: discord.Member = None):
+    logger.info("Commande !rank exécutée")
+    member = member or ctx.author
+    xp, level = xp_engine.get(ctx.guild.id, member.id)
+    position, total = await leaderboard.rank(ctx.guild.id, member.id)
+    if position is None:
+        await ctx.send(f"{member.display_name} n'a pas encore d'XP.")
+        return
+    await ctx.send(f"{member.display_name} : niveau {level}, {xp} XP, rang #{position}/{total}")
+
+@bot.command(name='leaderboard')
+@commands.guild_only()
+async def show_leaderboard(ctx, page: int = 1):
+    logger.info("Commande !leaderboard exécutée")
+    page = min(max(page, 1), await leaderboard.page_count(ctx.guild.id))
+    await ctx.send(embed=await leaderboard.embed(ctx.guild.id, page, ctx.guild.name))
 
 # !changeurl (mods seulement, ajoute https:// si nécessaire)
 @bot.command(name='changeurl')
@@ -90,8 +335,8 @@ async def change_url(ctx, *, new_url):
     logger.info("Commande !changeurl exécutée")
     if not new_url.startswith(('http://', 'https://')):
         new_url = 'https://' + new_url
-    data['url'] = new_url
-    save_data()
+    guilds.set_url(guild_id(ctx), new_url)
+    await guild_changed(guild_id(ctx))
     await ctx.send(f"URL changée en : {new_url}")
 
 # Modération
@@ -117,16 +362,39 @@ async def ban(ctx, member: discord.Member, *, reason=None):
 
 @bot.command(name='mute')
 @commands.has_permissions(manage_roles=True)
-async def mute(ctx, member: discord.Member):
+async def mute(ctx, member: discord.Member, duration: str = None):
     logger.info("Commande !mute exécutée")
     try:
-        mute_role = discord.utils.get(ctx.guild.roles, name="Muted")
-        if not mute_role:
-            mute_role = await ctx.guild.create_role(name="Muted")
-            for channel in ctx.guild.channels:
-                await channel.set_permissions(mute_role, send_messages=False)
+        seconds = None
+        if duration:
+            seconds = parse_duration(duration)
+            if seconds is None:
+                await ctx.send("Durée invalide. Exemples : 30s, 10m, 2h, 1d.")
+                return
+        mute_role = await get_mute_role(ctx.guild)
         await member.add_roles(mute_role)
-        await ctx.send(f"{member} muté.")
+
+        # Configuration des salons (reprend là où elle s'était arrêtée si interrompue)
+        progress_message = None
+
+        async def progress(done, total):
+            nonlocal progress_message
+            text = f"Configuration du rôle {MUTE_ROLE_NAME} : {done}/{total} salons"
+            if progress_message is None:
+                progress_message = await ctx.send(text)
+            else:
+                await progress_message.edit(content=text)
+
+        configured, failed = await ensure_mute_overwrites(ctx.guild, mute_role, progress)
+        if failed:
+            await ctx.send(f"{failed} salon(s) n'ont pas pu être configurés, ils le seront au prochain !mute.")
+
+        if seconds:
+            mute_scheduler.schedule(ctx.guild.id, member.id, seconds)
+            await ctx.send(f"{member} muté pour {duration}.")
+        else:
+            mute_scheduler.cancel(ctx.guild.id, member.id)
+            await ctx.send(f"{member} muté.")
     except Exception as e:
         await ctx.send(f"Erreur lors du mute : {str(e)}")
 
@@ -135,7 +403,8 @@ async def mute(ctx, member: discord.Member):
 async def unmute(ctx, member: discord.Member):
     logger.info("Commande !unmute exécutée")
     try:
-        mute_role = discord.utils.get(ctx.guild.roles, name="Muted")
+        mute_role = discord.utils.get(ctx.guild.roles, name=MUTE_ROLE_NAME)
+        mute_scheduler.cancel(ctx.guild.id, member.id)
         if mute_role:
             await member.remove_roles(mute_role)
             await ctx.send(f"{member} démuté.")
@@ -146,181 +415,134 @@ async def unmute(ctx, member: discord.Member):
 
 @bot.command(name='clear')
 @commands.has_permissions(manage_messages=True)
-async def clear(ctx, amount: int = 5):
+async def clear(ctx, amount: int = 5, *, options: str = ''):
     logger.info("Commande !clear exécutée")
     try:
-        if amount > 100:
-            await ctx.send("Maximum 100 messages à la fois.")
+        if amount < 1:
+            await ctx.send("Le nombre de messages doit être au moins 1.")
+            return
+        if amount > PURGE_MAX:
+            await ctx.send(f"Maximum {PURGE_MAX} messages à la fois.")
             return
-        await ctx.channel.purge(limit=amount + 1)
-        await ctx.send(f"{amount} messages supprimés.", delete_after=5)
+        if ctx.channel.id in purge_jobs:
+            await ctx.send("Un clear est déjà en cours dans ce salon (!clearstop pour l'annuler).")
+            return
+        check = PurgeFilter.parse(options, ctx.message.mentions)
+        progress_message = await ctx.send("Suppression en cours... (!clearstop pour annuler)")
+
+        async def progress(job, final):
+            if final:
+                status = "annulé" if job.cancelled else "terminé"
+                await progress_message.edit(content=f"Clear {status} : {job.deleted} messages supprimés.", delete_after=5)
+            else:
+                await progress_message.edit(content=f"Suppression en cours : {job.deleted}/{amount} (!clearstop pour annuler)")
+
+        job = purge_jobs[ctx.channel.id] = PurgeJob(ctx.channel, amount, check, before=ctx.message, progress=progress)
+        try:
+            await ctx.message.delete()
+            await job.run()
+        finally:
+            purge_jobs.pop(ctx.channel.id, None)
     except Exception as e:
         await ctx.send(f"Erreur lors du clear : {str(e)}")
 
+@bot.command(name='clearstop')
+@commands.has_permissions(manage_messages=True)
+async def clear_stop(ctx):
+    logger.info("Commande !clearstop exécutée")
+    job = purge_jobs.get(ctx.channel.id)
+    if job:
+        job.cancel()
+        await ctx.message.delete()
+    else:
+        await ctx.send("Aucun clear en cours dans ce salon.")
+
 @bot.command(name='addbanned')
 @commands.has_permissions(manage_messages=True)
 async def add_banned(ctx, *, word):
     logger.info("Commande !addbanned exécutée")
     try:
-        if word not in data['banned_words']:
-            data['banned_words'].append(word.lower())
-            save_data()
+        if guilds.add_banned_word(guild_id(ctx), word.lower()):
+            get_filter(guilds.get(guild_id(ctx))).add(word.lower())
+            await guild_changed(guild_id(ctx))
             await ctx.send(f"Mot '{word}' ajouté à la liste interdite.")
     except Exception as e:
         await ctx.send(f"Erreur lors de l'ajout du mot : {str(e)}")
 
+@bot.command(name='removebanned')
+@commands.has_permissions(manage_messages=True)
+async def remove_banned(ctx, *, word):
+    logger.info("Commande !removebanned exécutée")
+    try:
+        if guilds.remove_banned_word(guild_id(ctx), word.lower()):
+            get_filter(guilds.get(guild_id(ctx))).remove(word.lower())
+            await guild_changed(guild_id(ctx))
+            await ctx.send(f"Mot '{word}' retiré de la liste interdite.")
+        else:
+            await ctx.send(f"Le mot '{word}' n'est pas dans la liste interdite.")
+    except Exception as e:
+        await ctx.send(f"Erreur lors du retrait du mot : {str(e)}")
+
 # Commandes custom
 @bot.command(name='addcmd')
 @commands.has_permissions(manage_messages=True)
 async def add_custom(ctx, name: str, *, response):
-    logger.info(f"Commande !addcmd exécutée pour ajouter '!{name}' avec réponse : {response}")
+    logger.info("Commande !addcmd exécutée pour ajouter '!%s' avec réponse : %s", name, response)
     try:
-        if name.lower() in [cmd.name for cmd in bot.commands]:
+        if name.lower() in bot.all_commands or name.lower() in MUSIC_COMMANDS:
             await ctx.send(f"Erreur : Une commande nommée '!{name}' existe déjà.")
             return
-        data['custom_cmds'][name.lower()] = response
-        save_data()
+        guilds.set_custom_cmd(guild_id(ctx), name.lower(), response)
+        await guild_changed(guild_id(ctx))
         await ctx.send(f"Commande !{name} ajoutée.")
-        logger.info(f"Commandes personnalisées après ajout : {list(data['custom_cmds'].keys())}")
+        logger.info("Commandes personnalisées après ajout : %s", list(guilds.get(guild_id(ctx))['custom_cmds'].keys()))
     except Exception as e:
         await ctx.send(f"Erreur lors de l'ajout de la commande : {str(e)}")
 
-# Gestion des erreurs et commandes personnalisées
+# Gestion des erreurs (les commandes personnalisées sont servies dans on_message)
 @bot.event
 async def on_command_error(ctx, error):
+    if ctx.command is not None:
+        original = getattr(error, 'original', error)
+        command_errors.inc(ctx.command.qualified_name, type(original).__name__)
     if isinstance(error, commands.CommandNotFound):
-        cmd_name = ctx.invoked_with.lower()
-        logger.info(f"Commande non trouvée : {cmd_name}, vérification des commandes personnalisées...")
-        if cmd_name in data['custom_cmds']:
-            logger.info(f"Commande personnalisée trouvée : {cmd_name}")
-            await ctx.send(data['custom_cmds'][cmd_name])
-        else:
-            await ctx.send(f"Commande '{cmd_name}' non trouvée. Tapez !help pour la liste des commandes.")
+        await ctx.send(f"Commande '{ctx.invoked_with}' non trouvée. Tapez !help pour la liste des commandes.")
     elif isinstance(error, commands.MissingPermissions):
         await ctx.send("Vous n'avez pas les permissions pour cette commande.")
     elif isinstance(error, commands.MissingRequiredArgument):
         await ctx.send("Argument manquant. Vérifiez !help.")
     else:
         await ctx.send(f"Erreur inattendue : {str(error)}")
-        logger.error(f"Erreur inattendue dans on_command_error : {str(error)}")
-
-# Musique avec gestion robuste des erreurs
-@bot.command(name='play')
-async def play(ctx, url: str):
-    logger.info(f"Commande !play exécutée avec URL : {url}")
-    if not ctx.author.voice:
-        await ctx.send("Rejoins un salon vocal d'abord !")
-        return
-
-    channel = ctx.author.voice.channel
-    permissions = channel.permissions_for(ctx.guild.me)
-    if not permissions.connect or not permissions.speak:
-        await ctx.send("Je n'ai pas les permissions pour rejoindre ou parler dans ce salon vocal.")
-        return
+        logger.error("Erreur inattendue dans on_command_error : %s", error)
 
-    if ctx.guild.voice_client:
-        logger.info("Déconnexion du salon vocal existant")
-        await ctx.guild.voice_client.disconnect(force=True)
-
-    max_attempts = 3
-    for attempt in range(max_attempts):
-        try:
-            logger.info(f"Tentative de connexion vocale {attempt + 1}/{max_attempts}")
-            voice_client = await channel.connect(timeout=20.0, reconnect=True)
-            break
-        except (asyncio.TimeoutError, Exception) as e:
-            logger.error(f"Erreur de connexion vocale (tentative {attempt + 1}): {str(e)}")
-            if attempt == max_attempts - 1:
-                await ctx.send(f"Échec de la connexion au salon vocal après {max_attempts} tentatives : {str(e)}")
-                return
-            await asyncio.sleep(3)  # Délai plus long entre tentatives
-
-    # Options yt-dlp avec fallback et timeout
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'noplaylist': True,
-        'quiet': True,
-        'no_warnings': True,
-        'default_search': 'auto',
-        'source_address': '0.0.0.0',
-        'cookiefile': 'cookies.txt' if os.path.exists('cookies.txt') else None,
-        'http_headers': {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        },
-        'socket_timeout': 10,
-        'ignoreerrors': True,
-        'retry_max': 3,
-        'sleep_interval': 5,
-        'max_sleep_interval': 10,
-    }
-
-    try:
-        logger.info("Extraction de l'URL YouTube...")
-        async with asyncio.timeout(30):  # Timeout de 30s pour l'extraction
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if not info:
-                    await ctx.send("Échec de l'extraction de la vidéo. Essayez une autre URL.")
-                    await voice_client.disconnect()
-                    return
-                if 'entries' in info:
-                    info = info['entries'][0]
-                audio_url = info.get('url')
-                title = info.get('title', 'Inconnu')
-                await ctx.send(f"Lecture en cours : **{title}**")
-                ffmpeg_path = "ffmpeg"  # Render a FFmpeg dans /usr/bin
-                source = discord.FFmpegPCMAudio(
-                    audio_url,
-                    executable=ffmpeg_path,
-                    options='-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
-                )
-                voice_client.play(source)
-    except asyncio.TimeoutError:
-        logger.error("Timeout lors de l'extraction YouTube")
-        await ctx.send("Délai d'extraction dépassé. Essayez une autre URL ou réessayez plus tard.")
-        await voice_client.disconnect()
-        return
-    except Exception as e:
-        logger.error(f"Erreur lors de l'extraction ou lecture YouTube : {str(e)}")
-        await ctx.send(f"Erreur lors de la lecture de la vidéo : {str(e)}")
-        await voice_client.disconnect()
-        return
-
-    while voice_client.is_playing():
-        await asyncio.sleep(1)
-    logger.info("Lecture terminée, déconnexion du salon vocal")
-    await voice_client.disconnect()
-
-@bot.command(name='pause')
-async def pause(ctx):
-    logger.info("Commande !pause exécutée")
-    if ctx.guild.voice_client and ctx.guild.voice_client.is_playing():
-        ctx.guild.voice_client.pause()
-        await ctx.send("Musique en pause.")
-    else:
-        await ctx.send("Aucune musique en cours.")
-
-@bot.command(name='stop')
-async def stop(ctx):
-    logger.info("Commande !stop exécutée")
-    if ctx.guild.voice_client:
-        ctx.guild.voice_client.stop()
-        await ctx.guild.voice_client.disconnect(force=True)
-        await ctx.send("Musique arrêtée et déconnexion.")
-    else:
-        await ctx.send("Pas connecté à un salon vocal.")
-
-@bot.command(name='skip')
-async def skip(ctx):
-    logger.info("Commande !skip exécutée")
-    if ctx.guild.voice_client and ctx.guild.voice_client.is_playing():
-        ctx.guild.voice_client.stop()
-        await ctx.send("Musique passée.")
-    else:
-        await ctx.send("Aucune musique à passer.")
-
-# Lancer le keep-alive pour 24/7
-keep_alive()
+# Statistiques de performance (mods seulement)
+@bot.command(name='stats')
+@commands.has_permissions(manage_messages=True)
+async def stats(ctx):
+    logger.info("Commande !stats exécutée")
+    embed = discord.Embed(title="Statistiques du bot", color=0x00ff00)
+    lines = []
+    names = sorted(metrics.command_duration.label_sets(), key=lambda labels: -metrics.commands_total.get(*labels))
+    for labels in names[:15]:
+        count, total, p50, p99 = metrics.command_duration.summary(*labels)
+        errors = sum(value for (command, _), value in command_errors.items() if command == labels[0])
+        api = command_api_seconds.get(*labels)
+        lines.append(f"`!{labels[0]}` ×{count} · moy {total / count * 1000:.0f} ms · p50 ≤{p50 * 1000:.0f} ms · "
+                     f"p99 ≤{p99 * 1000:.0f} ms · API {api / count * 1000:.0f} ms · erreurs {errors}")
+    embed.add_field(name="Commandes", value="\n".join(lines) or "Aucune commande exécutée.", inline=False)
+    _, _, lag_p50, lag_p99 = loop_lag.summary()
+    embed.add_field(name="Boucle asyncio", value=(
+        f"Retard p50 ≤{(lag_p50 or 0) * 1000:.0f} ms · p99 ≤{(lag_p99 or 0) * 1000:.0f} ms · "
+        f"max {lag_monitor.max_lag * 1000:.0f} ms · blocages {loop_blocked.get()}"), inline=False)
+    embed.add_field(name="Gateway", value=f"Latence {bot.latency * 1000:.0f} ms", inline=False)
+    rss = rss_bytes()
+    caches = " · ".join(f"{name} {entries} ({size / 1024:.0f} Kio)" for name, (entries, size) in cache_report(bot).items())
+    embed.add_field(name="Mémoire", value=(
+        f"RSS {rss / 1048576:.1f} Mio · {rss / max(len(bot.guilds), 1) / 1024:.0f} Kio/serveur\n{caches}"), inline=False)
+    embed.set_footer(text="Export Prometheus : /metrics")
+    await ctx.send(embed=embed)
 
 # Lance le bot
-bot.run(TOKEN)
+# log_handler=None : discord.py utilise la file de logs configurée plus haut
+if __name__ == '__main__':
+    bot.run(TOKEN, log_handler=None)
@@ -0,0 +1,216 @@
+import asyncio
+import atexit
+import collections
+import json
+import logging
+import os
+import re
+import time
+from urllib.parse import parse_qs, urlparse
+
+from extraction import extraction_pool
+
+logger = logging.getLogger(__name__)
+
+# Configuration du cache (variables d'environnement)
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(4 * 1024 * 1024)))
+MEDIA_CACHE_DEFAULT_TTL = float(os.getenv('MEDIA_CACHE_DEFAULT_TTL', '3600'))
+MEDIA_CACHE_FILE = os.getenv('MEDIA_CACHE_FILE')  # ex : media_cache.json (désactivé si vide)
+MEDIA_CACHE_MAX_GAINS = int(os.getenv('MEDIA_CACHE_MAX_GAINS', '100000'))  # gains de volume mémorisés
+# Gains de normalisation : conservés par défaut d'un démarrage à l'autre (une analyse par piste)
+MEDIA_GAINS_FILE = os.getenv('MEDIA_GAINS_FILE', 'loudness.json')  # désactivé si vide
+
+# Marge avant l'expiration de l'URL signée, pour ne pas lancer ffmpeg sur une URL mourante
+EXPIRY_MARGIN = 300
+
+_YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+def normalize_key(query):
+    query = query.strip()
+    parsed = urlparse(query)
+    if parsed.scheme in ('http', 'https') and parsed.netloc:
+        host = parsed.netloc.lower().removeprefix('www.').removeprefix('m.').removeprefix('music.')
+        video_id = None
+        if host == 'youtu.be':
+            video_id = parsed.path.lstrip('/').split('/')[0]
+        elif host == 'youtube.com':
+            if parsed.path == '/watch':
+                video_id = parse_qs(parsed.query).get('v', [None])[0]
+            elif parsed.path.startswith(('/shorts/', '/live/', '/embed/')):
+                video_id = parsed.path.split('/')[2]
+        if video_id and _YOUTUBE_ID.match(video_id):
+            return f'youtube:{video_id}'
+        return f'{parsed.scheme}://{host}{parsed.path}' + (f'?{parsed.query}' if parsed.query else '')
+    return 'search:' + ' '.join(query.lower().split())
+
+
+def track_key(info):
+    # Clé stable d'une piste résolue (une recherche et l'URL directe donnent la même)
+    return normalize_key(info.get('webpage_url') or info.get('url') or '')
+
+
+def stream_expiry(audio_url, now=None):
+    # Les URLs googlevideo portent leur date d'expiration dans le paramètre "expire"
+    now = now or time.time()
+    try:
+        expire = parse_qs(urlparse(audio_url).query).get('expire', [None])[0]
+        if expire:
+            return float(expire) - EXPIRY_MARGIN
+    except (TypeError, ValueError):
+        pass
+    return now + MEDIA_CACHE_DEFAULT_TTL
+
+
+def _entry_size(key, info):
+    return len(key) + sum(len(str(k)) + len(str(v)) for k, v in info.items()) + 64
+
+
+class MediaCache:
+    def __init__(self, max_bytes=MEDIA_CACHE_MAX_BYTES, path=MEDIA_CACHE_FILE, gains_path=MEDIA_GAINS_FILE):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.gains_path = gains_path
+        self._entries = collections.OrderedDict()  # clé -> (expiration, info, taille)
+        self._inflight = {}
+        # Gain de normalisation (dB) par piste : n'expire pas avec l'URL du flux
+        self._gains = collections.OrderedDict()
+        self.size = 0
+        # Métriques
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.path:
+            self.load()
+        if self.gains_path:
+            self.load_gains()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query):
+        key = normalize_key(query)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, info, _ = entry
+        if expires <= time.time():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return info
+
+    def put(self, query, info, expires=None):
+        if not info or not info.get('url'):
+            return
+        key = normalize_key(query)
+        if expires is None:
+            expires = stream_expiry(info['url'])
+        if key in self._entries:
+            self._remove(key)
+        size = _entry_size(key, info)
+        self._entries[key] = (expires, info, size)
+        self.size += size
+        while self.size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.size -= size
+
+    def gain(self, info):
+        return self._gains.get(track_key(info))
+
+    def set_gain(self, info, gain):
+        key = track_key(info)
+        self._gains[key] = gain
+        self._gains.move_to_end(key)
+        while len(self._gains) > MEDIA_CACHE_MAX_GAINS:
+            self._gains.popitem(last=False)
+
+    async def resolve(self, query):
+        info = self.get(query)
+        if info is not None:
+            return info
+        # Requêtes simultanées pour la même piste : une seule extraction
+        key = normalize_key(query)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(extraction_pool.extract(query))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        info = await asyncio.shield(task)
+        self.put(query, info)
+        return info
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'gains': len(self._gains),
+        }
+
+    def load(self):
+        try:
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            now = time.time()
+            if 'entries' in saved:
+                # Ancien format, gains compris
+                self._gains.update(saved.get('gains', {}))
+                saved = saved['entries']
+            for key, (expires, info) in saved.items():
+                if expires > now:
+                    size = _entry_size(key, info)
+                    self._entries[key] = (expires, info, size)
+                    self.size += size
+            logger.info("Cache média chargé : %s entrées", len(self._entries))
+        except Exception as e:
+            logger.error("Erreur lors du chargement de %s: %s", self.path, e)
+
+    def load_gains(self):
+        try:
+            if not os.path.exists(self.gains_path):
+                return
+            with open(self.gains_path, 'r', encoding='utf-8') as f:
+                self._gains.update(json.load(f))
+            logger.info("Gains de normalisation chargés : %s pistes", len(self._gains))
+        except Exception as e:
+            logger.error("Erreur lors du chargement de %s: %s", self.gains_path, e)
+
+    def save(self):
+        if self.gains_path and self._gains:
+            self._dump(self.gains_path, self._gains)
+        if not self.path:
+            return
+        now = time.time()
+        saved = {key: (expires, info) for key, (expires, info, _) in self._entries.items() if expires > now}
+        if self._dump(self.path, saved):
+            logger.info("Cache média enregistré : %s entrées", len(saved))
+
+    def _dump(self, path, saved):
+        try:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(saved, f)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            logger.error("Erreur lors de l'enregistrement de %s: %s", path, e)
+            return False
+
+
+media_cache = MediaCache()
+atexit.register(media_cache.save)
@@ -0,0 +1,137 @@
+import math
+import threading
+
+# Registre de métriques minimal au format texte Prometheus
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def items(self):
+        return list(self._values.items())
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in self.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [compteurs par bucket..., somme, nombre]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def summary(self, *labels):
+        # (nombre, somme, quantiles approximatifs p50/p99 à partir des buckets)
+        state = self._values.get(labels)
+        if not state:
+            return 0, 0.0, None, None
+        count = state[-1]
+
+        def quantile(q):
+            target = q * count
+            seen = 0
+            for i, bound in enumerate(self.buckets):
+                seen += state[i]
+                if seen >= target:
+                    return bound
+            return math.inf
+        return count, state[-2], quantile(0.5), quantile(0.99)
+
+    def label_sets(self):
+        return list(self._values)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, state in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", _format_value(bound))])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", "+Inf")])} {state[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {state[-1]}')
+        return lines
+
+
+class Gauge:
+    # Valeur lue au moment de l'export : func() renvoie un nombre ou {labels: nombre}
+    def __init__(self, name, documentation, func, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        value = self.func()
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, sample in values:
+            if not isinstance(labels, tuple):
+                labels = (labels,)
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(sample)}')
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Métriques des commandes
+commands_total = Counter('bot_commands_total', 'Commandes exécutées', ('command',))
+command_duration = Histogram('bot_command_duration_seconds', "Durée d'exécution des commandes", ('command',))
@@ -0,0 +1,99 @@
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.25'))
+LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.5'))
+
+# Commande en cours dans la tâche courante : [nom, secondes passées dans l'API Discord]
+current_command = contextvars.ContextVar('current_command', default=None)
+
+command_errors = metrics.Counter('bot_command_errors_total', 'Erreurs des commandes', ('command', 'error'))
+command_api_seconds = metrics.Counter('bot_command_api_seconds_total',
+                                      "Temps passé dans l'API Discord par commande", ('command',))
+api_duration = metrics.Histogram('bot_discord_api_duration_seconds', "Durée des appels à l'API Discord",
+                                 ('method', 'route'))
+loop_lag = metrics.Histogram('bot_event_loop_lag_seconds', 'Retard de la boucle asyncio',
+                             buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+loop_blocked = metrics.Counter('bot_event_loop_blocked_total', 'Blocages de la boucle au-delà du seuil')
+
+
+def instrument_http(http):
+    # Mesure chaque requête REST et l'attribue à la commande en cours
+    original_request = http.request
+
+    async def request(route, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await original_request(route, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            api_duration.observe(elapsed, route.method, route.path)
+            state = current_command.get()
+            if state is not None:
+                state[1] += elapsed
+
+    http.request = request
+
+
+class LoopLagMonitor:
+    # Une coroutine mesure le retard de réveil de la boucle ; un thread de
+    # surveillance journalise la pile du thread de la boucle si elle reste bloquée.
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL, threshold=LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_lag = 0.0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._beat())
+        threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _beat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            loop_lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            self._last_beat = now
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop.wait(self.threshold / 2):
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat - self.interval
+            if blocked_for < self.threshold or reported_beat == last_beat:
+                continue
+            # Un seul rapport par blocage
+            reported_beat = last_beat
+            loop_blocked.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame else '(pile indisponible)'
+            logger.warning("Boucle asyncio bloquée depuis %.2fs :\n%s", blocked_for, stack)
+
+
+lag_monitor = LoopLagMonitor()
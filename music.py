@@ -0,0 +1,529 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import re
+import time
+from urllib.parse import parse_qs, urlparse
+
+import discord
+
+from audio_cache import audio_cache, LocalOpusAudio
+from extraction import ExtractionBusy, extraction_pool
+from ffmpeg_admission import (ffmpeg_admission, degraded, FFmpegBusy, WEIGHT_COPY, WEIGHT_TRANSCODE, WEIGHT_DEGRADED,
+                              WEIGHT_PROBE)
+from loudness import gain_for, loudness_analyzer, LOUDNESS_PASSTHROUGH
+from media_cache import media_cache
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_PATH = "ffmpeg"  # Render a FFmpeg dans /usr/bin
+VOICE_CONNECT_ATTEMPTS = 3
+VOICE_CONNECT_TIMEOUT = float(os.getenv('VOICE_CONNECT_TIMEOUT', '10'))
+VOICE_IDLE_GRACE = float(os.getenv('VOICE_IDLE_GRACE', '300'))  # session gardée après la file (0 : déconnexion immédiate)
+DEGRADED_BITRATE = 64  # kb/s, quand le budget CPU ffmpeg est atteint
+FFMPEG_RETRY_DELAY = float(os.getenv('FFMPEG_RETRY_DELAY', '15'))  # nouvel essai de la file quand le budget est plein
+AUDIO_MODE = os.getenv('AUDIO_MODE', 'opus')  # 'opus' (passthrough si possible) ou 'pcm'
+PREFETCH_DEPTH = int(os.getenv('PREFETCH_DEPTH', '1'))  # morceaux résolus à l'avance
+PLAYLIST_FIRST_CHUNK = 5  # la lecture démarre dès ces premières entrées
+PLAYLIST_CHUNK = int(os.getenv('PLAYLIST_CHUNK', '50'))
+PLAYLIST_MAX_TRACKS = int(os.getenv('PLAYLIST_MAX_TRACKS', '500'))
+# Sessions sauvegardées à l'arrêt et reprises au démarrage suivant (un fichier par worker du cluster)
+SESSION_FILE = os.getenv('SESSION_FILE', 'sessions.json')  # désactivé si vide
+SESSION_MAX_AGE = float(os.getenv('SESSION_MAX_AGE', '900'))  # secondes : au-delà, sessions abandonnées
+if SESSION_FILE and os.getenv('SHARD_IDS'):
+    # Worker du cluster : fichier nommé d'après son premier shard
+    _base, _ext = os.path.splitext(SESSION_FILE)
+    SESSION_FILE = f"{_base}-{os.getenv('SHARD_IDS').split(',')[0]}{_ext}"
+
+# Options d'entrée : les flags de reconnexion ne s'appliquent qu'avant -i
+FFMPEG_BEFORE_OPTIONS = '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5'
+FFMPEG_OPTIONS = '-vn'
+
+
+_MULTI_SEARCH = re.compile(r'^[a-z]+search(\d+|all):', re.IGNORECASE)
+
+
+def is_playlist_query(query):
+    # Playlists (paramètre list=, pages /playlist) et recherches multiples ("ytsearch5:...")
+    if _MULTI_SEARCH.match(query):
+        return True
+    parsed = urlparse(query)
+    if parsed.scheme not in ('http', 'https'):
+        return False
+    params = parse_qs(parsed.query)
+    if 'v' in params or parsed.netloc.lower().endswith('youtu.be'):
+        # Vidéo partagée depuis une playlist ou un mix (watch?v=X&list=RD...) : seule la vidéo est jouée
+        return False
+    return 'list' in params or parsed.path.rstrip('/').endswith('/playlist')
+
+
+async def create_source(info, start_at=0):
+    # La source porte son poids ffmpeg (admission_weight), rendu à la fin de la lecture ;
+    # start_at : position de départ en secondes (reprise après redémarrage)
+    local_path = audio_cache.lookup(info)
+    acodec = 'opus' if local_path else info.get('acodec')
+    bitrate = 128
+    options = FFMPEG_OPTIONS
+    weight = None
+    gain = gain_for(info)
+    passthrough = AUDIO_MODE != 'pcm' and acodec == 'opus'
+    if gain is not None and passthrough:
+        # Le gain impose de décoder : seulement sur demande (LOUDNESS_PASSTHROUGH) et
+        # s'il reste du budget CPU, sinon lecture telle quelle
+        if LOUDNESS_PASSTHROUGH and ffmpeg_admission.try_acquire(WEIGHT_TRANSCODE):
+            weight = WEIGHT_TRANSCODE
+            passthrough = False
+        else:
+            gain = None
+
+    if local_path and passthrough:
+        # Piste en cache disque : ni réseau, ni processus ffmpeg
+        source = LocalOpusAudio(local_path, start_at=start_at)
+        source.admission_weight = 0
+        source.passthrough = True
+        return source
+
+    if gain is not None:
+        # Gain constant précalculé (voir loudness.py) : bien moins coûteux que loudnorm
+        options += f' -af volume={gain:.1f}dB'
+    if weight is None:
+        if AUDIO_MODE == 'pcm':
+            weight = WEIGHT_TRANSCODE
+            await ffmpeg_admission.acquire(weight)
+        elif passthrough:
+            weight = WEIGHT_COPY
+            await ffmpeg_admission.acquire(weight)
+        elif ffmpeg_admission.try_acquire(WEIGHT_TRANSCODE):
+            weight = WEIGHT_TRANSCODE
+        else:
+            # Budget CPU atteint : transcodage allégé plutôt qu'une attente
+            weight = WEIGHT_DEGRADED
+            await ffmpeg_admission.acquire(weight)
+            degraded.inc()
+            bitrate = DEGRADED_BITRATE
+            options += ' -compression_level 0'
+
+    try:
+        source = await _ffmpeg_source(info, local_path, acodec, passthrough, bitrate, options, start_at)
+    except BaseException:
+        ffmpeg_admission.release(weight)
+        raise
+    source.admission_weight = weight
+    source.passthrough = passthrough
+    return source
+
+
+async def _ffmpeg_source(info, local_path, acodec, passthrough, bitrate, options, start_at=0):
+    # Fichier du cache disque : pas d'options de reconnexion
+    audio_url = local_path or info['url']
+    before_options = None if local_path else FFMPEG_BEFORE_OPTIONS
+    if start_at:
+        # -ss avant -i : recherche dans l'entrée (requêtes HTTP Range), sans décoder le début
+        before_options = f"{before_options or ''} -ss {start_at:.1f}".strip()
+    if AUDIO_MODE == 'pcm':
+        return discord.FFmpegPCMAudio(
+            audio_url,
+            executable=FFMPEG_PATH,
+            before_options=before_options,
+            options=options
+        )
+    if passthrough:
+        # Passthrough : ffmpeg ne fait que remuxer les trames Opus, sans décodage
+        codec = 'copy'
+    elif acodec and acodec != 'none':
+        # Codec connu mais différent : ffmpeg transcode directement en Opus
+        codec = None
+    else:
+        # Codec inconnu : on le détecte avec ffprobe, un processus de plus dans le budget
+        await ffmpeg_admission.acquire(WEIGHT_PROBE)
+        try:
+            return await discord.FFmpegOpusAudio.from_probe(
+                audio_url,
+                executable=FFMPEG_PATH,
+                before_options=before_options,
+                options=options
+            )
+        finally:
+            ffmpeg_admission.release(WEIGHT_PROBE)
+    return discord.FFmpegOpusAudio(
+        audio_url,
+        bitrate=bitrate,
+        codec=codec,
+        executable=FFMPEG_PATH,
+        before_options=before_options,
+        options=options
+    )
+
+
+class Track:
+    def __init__(self, query, requested_by=None, title=None):
+        self.query = query
+        self.requested_by = requested_by
+        self.known_title = title  # titre connu avant résolution (entrée de playlist)
+        self.start_at = 0  # position de reprise (secondes)
+        self.info = None
+        self.error = None
+        self._resolve_task = None
+
+    @property
+    def title(self):
+        if self.info:
+            return self.info.get('title') or 'Inconnu'
+        return self.known_title or self.query
+
+    def resolve(self):
+        # Une seule extraction par piste, partagée entre préchargement et lecture
+        if self._resolve_task is None:
+            self._resolve_task = asyncio.create_task(self._resolve())
+        return self._resolve_task
+
+    async def _resolve(self):
+        try:
+            self.info = await media_cache.resolve(self.query)
+        except ExtractionBusy:
+            self.error = "Trop de demandes de musique en cours. Réessayez dans un instant."
+        except asyncio.TimeoutError:
+            self.error = "Délai d'extraction dépassé. Essayez une autre URL ou réessayez plus tard."
+        except Exception as e:
+            logger.error("Erreur lors de l'extraction YouTube : %s", e)
+            self.error = f"Erreur lors de la lecture de la vidéo : {str(e)}"
+        if not self.error and not (self.info and self.info.get('url')):
+            self.error = "Échec de l'extraction de la vidéo. Essayez une autre URL."
+        return self.info
+
+
+class GuildPlayer:
+    def __init__(self, guild):
+        self.guild = guild
+        self.queue = collections.deque()
+        self.current = None
+        self.text_channel = None
+        self.stopped = False
+        self.loader = None  # tâche d'ajout d'une playlist en cours
+        self._loop = asyncio.get_running_loop()
+        self._advance_lock = asyncio.Lock()
+        self._connect_task = None
+        self._idle_handle = None
+        self._retry_handle = None  # nouvel essai de la file après un refus de ffmpeg_admission
+        self._admission_weight = None  # poids ffmpeg de la lecture en cours
+        self._started_at = None  # horloge monotone, corrigée de la position de départ
+        self._paused_at = None
+
+    @property
+    def active(self):
+        return self.current is not None or bool(self.queue) or self._advance_lock.locked()
+
+    @property
+    def voice_client(self):
+        return self.guild.voice_client
+
+    @property
+    def position(self):
+        # Secondes écoulées dans le morceau courant
+        if self.current is None or self._started_at is None:
+            return 0.0
+        return max(0.0, (self._paused_at or time.monotonic()) - self._started_at)
+
+    async def connect(self, channel):
+        # Réutilise la connexion existante (gardée au chaud après la file) au lieu
+        # de refaire la poignée de main vocale
+        self.cancel_idle()
+        voice_client = self.voice_client
+        if voice_client and voice_client.is_connected():
+            if voice_client.channel != channel:
+                await voice_client.move_to(channel)
+            return voice_client
+        # Plusieurs !play simultanés : une seule tentative de connexion partagée
+        if self._connect_task is None or self._connect_task.done():
+            self._connect_task = asyncio.create_task(self._connect(channel))
+        return await asyncio.shield(self._connect_task)
+
+    async def _connect(self, channel):
+        voice_client = self.voice_client
+        if voice_client:
+            await voice_client.disconnect(force=True)
+        for attempt in range(VOICE_CONNECT_ATTEMPTS):
+            try:
+                logger.info("Tentative de connexion vocale %s/%s", attempt + 1, VOICE_CONNECT_ATTEMPTS)
+                return await channel.connect(timeout=VOICE_CONNECT_TIMEOUT, reconnect=True)
+            except (asyncio.TimeoutError, Exception) as e:
+                logger.error("Erreur de connexion vocale (tentative %s): %s", attempt + 1, e)
+                if attempt == VOICE_CONNECT_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+    def cancel_idle(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def schedule_idle(self):
+        # File terminée : la session vocale reste ouverte VOICE_IDLE_GRACE secondes
+        self.cancel_idle()
+        if VOICE_IDLE_GRACE <= 0:
+            asyncio.create_task(self.stop())
+            return
+        logger.info("File terminée, session vocale gardée %.0f s", VOICE_IDLE_GRACE)
+        self._idle_handle = self._loop.call_later(VOICE_IDLE_GRACE, lambda: asyncio.create_task(self._idle_timeout()))
+
+    async def _idle_timeout(self):
+        self._idle_handle = None
+        if not self.active:
+            logger.info("Session vocale inactive, déconnexion du salon vocal")
+            await self.stop()
+
+    def _release_ffmpeg(self):
+        if self._admission_weight is not None:
+            ffmpeg_admission.release(self._admission_weight)
+            self._admission_weight = None
+
+    def enqueue(self, track):
+        self.enqueue_many([track])
+
+    def enqueue_many(self, tracks):
+        # Un seul enchaînement pour tout le paquet, pas une tâche advance() par morceau
+        if not tracks:
+            return
+        self.cancel_idle()
+        self.queue.extend(tracks)
+        if self.current is None:
+            asyncio.create_task(self.advance())
+        else:
+            self.prefetch()
+
+    def prefetch(self):
+        # Résout l'URL des prochains morceaux pendant la lecture du morceau courant
+        for i in range(min(PREFETCH_DEPTH, len(self.queue))):
+            self.queue[i].resolve()
+
+    async def enqueue_playlist(self, query, requested_by=None):
+        # Ajoute les entrées par paquets : la lecture commence dès le premier,
+        # les URLs de flux ne sont résolues qu'au moment du préchargement
+        title = None
+        added = 0
+        start = 1
+        size = PLAYLIST_FIRST_CHUNK
+        limit = PLAYLIST_MAX_TRACKS
+        search = _MULTI_SEARCH.match(query)
+        if search and search.group(1).isdigit():
+            # "ytsearch5:..." : pas de page au-delà des résultats demandés
+            limit = min(limit, int(search.group(1)))
+        while added < limit and not self.stopped:
+            end = min(start + size - 1, limit)
+            result = await extraction_pool.extract_flat(query, start, end)
+            if not result:
+                break
+            title = title or result['title']
+            if result['entries'] is None:
+                # Une seule vidéo : déjà résolue, on évite une seconde extraction
+                media_cache.put(query, result['info'])
+                self.enqueue(Track(query, requested_by))
+                return title, 1
+            if self.stopped:
+                break
+            self.enqueue_many([Track(entry['url'], requested_by, title=entry['title']) for entry in result['entries']])
+            added += len(result['entries'])
+            if len(result['entries']) < end - start + 1:
+                break
+            start = end + 1
+            size = PLAYLIST_CHUNK
+        return title, added
+
+    def _after(self, error):
+        # Appelé depuis le thread audio de discord.py
+        if error:
+            logger.error("Erreur de lecture : %s", error)
+        self._loop.call_soon_threadsafe(self._release_ffmpeg)
+        if self.stopped:
+            return
+        self._loop.call_soon_threadsafe(lambda: asyncio.create_task(self.advance()))
+
+    async def advance(self):
+        async with self._advance_lock:
+            if self.stopped:
+                return
+            voice_client = self.voice_client
+            if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
+                return
+            self.current = None
+            while self.queue:
+                track = self.queue.popleft()
+                await track.resolve()
+                if track.error:
+                    await self.announce(track.error)
+                    continue
+                voice_client = self.voice_client
+                if not voice_client or not voice_client.is_connected():
+                    logger.info("Connexion vocale perdue, arrêt du lecteur")
+                    break
+                try:
+                    source = await create_source(track.info, track.start_at)
+                except FFmpegBusy:
+                    # Budget global plein : la file attend au lieu d'être vidée morceau par morceau
+                    self.queue.appendleft(track)
+                    if self._retry_handle is None:
+                        await self.announce("Trop de musiques en cours sur le bot, la lecture reprendra dès que possible.")
+                    self._schedule_retry()
+                    return
+                except Exception as e:
+                    logger.error("Erreur lors de la création de la source audio : %s", e)
+                    await self.announce(f"Erreur lors de la lecture de la vidéo : {str(e)}")
+                    continue
+                self.current = track
+                self._admission_weight = getattr(source, 'admission_weight', 0) or None
+                try:
+                    voice_client.play(source, after=self._after)
+                except discord.ClientException as e:
+                    logger.error("Impossible de lancer la lecture : %s", e)
+                    self._release_ffmpeg()
+                    source.cleanup()
+                    self.current = None
+                    continue
+                self._started_at = time.monotonic() - track.start_at
+                self._paused_at = None
+                self._cancel_retry()
+                audio_cache.record_play(track.info)
+                loudness_analyzer.schedule(track.info, getattr(source, 'passthrough', False))
+                await self.announce(f"Lecture en cours : **{track.title}**")
+                self.prefetch()
+                return
+
+        if self.voice_client and self.voice_client.is_connected():
+            self.schedule_idle()
+        else:
+            await self.stop()
+
+    def _schedule_retry(self):
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+        self._retry_handle = self._loop.call_later(FFMPEG_RETRY_DELAY, lambda: asyncio.create_task(self.advance()))
+
+    def _cancel_retry(self):
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+            self._retry_handle = None
+
+    def skip(self):
+        voice_client = self.voice_client
+        if voice_client and (voice_client.is_playing() or voice_client.is_paused()):
+            # stop() déclenche le callback after=, qui enchaîne sur le morceau suivant
+            voice_client.stop()
+            return True
+        return False
+
+    def pause(self):
+        voice_client = self.voice_client
+        if voice_client and voice_client.is_playing():
+            voice_client.pause()
+            self._paused_at = time.monotonic()
+            return True
+        return False
+
+    def resume(self):
+        voice_client = self.voice_client
+        if voice_client and voice_client.is_paused():
+            voice_client.resume()
+            # La pause ne compte pas dans la position du morceau
+            if self._paused_at is not None and self._started_at is not None:
+                self._started_at += time.monotonic() - self._paused_at
+            self._paused_at = None
+            return True
+        return False
+
+    def snapshot(self):
+        # État compact : salons, position dans le morceau courant, file de [requête, titre]
+        voice_client = self.voice_client
+        if self.stopped or not voice_client or not voice_client.is_connected():
+            return None
+        tracks = ([self.current] if self.current else []) + list(self.queue)
+        if not tracks:
+            return None
+        return {
+            'g': self.guild.id,
+            'v': voice_client.channel.id,
+            't': self.text_channel.id if self.text_channel else None,
+            'p': round(self.position, 1) if self.current else 0,
+            'q': [[track.query, track.known_title or (track.info or {}).get('title')] for track in tracks],
+        }
+
+    def restore(self, session):
+        tracks = [Track(query, title=title) for query, title in session['q']]
+        if tracks:
+            tracks[0].start_at = session['p']
+        for track in tracks:
+            self.enqueue(track)
+
+    async def stop(self):
+        self.stopped = True
+        self.cancel_idle()
+        self._cancel_retry()
+        if self.loader is not None:
+            self.loader.cancel()
+        self.queue.clear()
+        self.current = None
+        players.pop(self.guild.id, None)
+        voice_client = self.voice_client
+        if voice_client:
+            voice_client.stop()
+            await voice_client.disconnect(force=True)
+
+    async def announce(self, message):
+        if self.text_channel:
+            try:
+                await self.text_channel.send(message)
+            except discord.HTTPException as e:
+                logger.error("Impossible d'envoyer le message de lecture : %s", e)
+
+
+players = {}
+
+
+def get_player(guild):
+    player = players.get(guild.id)
+    if player is None:
+        player = players[guild.id] = GuildPlayer(guild)
+    return player
+
+
+def save_sessions():
+    # Appelé à l'arrêt, avant la déconnexion des salons vocaux
+    sessions = []
+    for player in list(players.values()):
+        session = player.snapshot()
+        if session:
+            sessions.append(session)
+        # Plus d'enchaînement : la déconnexion ne doit pas lancer le morceau suivant
+        player.stopped = True
+        if player.loader is not None:
+            player.loader.cancel()
+    if not SESSION_FILE:
+        return 0
+    try:
+        tmp_path = SESSION_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'at': time.time(), 'sessions': sessions}, f, separators=(',', ':'))
+        os.replace(tmp_path, SESSION_FILE)
+        logger.info("%s session(s) musicale(s) sauvegardée(s) dans %s", len(sessions), SESSION_FILE)
+    except Exception as e:
+        logger.error("Erreur lors de l'enregistrement de %s: %s", SESSION_FILE, e)
+    return len(sessions)
+
+
+def load_sessions():
+    # Lu une seule fois : le fichier est supprimé pour ne pas reprendre deux fois les mêmes sessions
+    if not SESSION_FILE or not os.path.exists(SESSION_FILE):
+        return []
+    try:
+        with open(SESSION_FILE, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        os.remove(SESSION_FILE)
+    except Exception as e:
+        logger.error("Erreur lors du chargement de %s: %s", SESSION_FILE, e)
+        return []
+    age = time.time() - saved.get('at', 0)
+    if age > SESSION_MAX_AGE:
+        logger.info("Sessions musicales trop anciennes (%.0f s), ignorées", age)
+        return []
+    return saved.get('sessions', [])
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+
+from discord.ext import commands
+
+import metrics
+from music import get_player, players, is_playlist_query, Track, VOICE_CONNECT_ATTEMPTS, load_sessions, save_sessions
+from audio_cache import audio_cache
+from extraction import ExtractionBusy, extraction_pool
+from media_cache import media_cache
+from loudness import loudness_analyzer
+
+# Commandes de musique, chargées comme extension : au premier !play ou en
+# arrière-plan après on_ready (voir main.py), pour ne pas retarder la connexion.
+
+logger = logging.getLogger(__name__)
+
+MUSIC_PRELOAD = os.getenv('MUSIC_PRELOAD', '1') == '1'  # précharge yt-dlp dès le chargement de l'extension
+
+metrics.Gauge('bot_extraction_queue_depth', "Extractions yt-dlp en attente ou en cours", lambda: extraction_pool.queue_depth)
+metrics.Gauge('bot_media_cache_hits', 'Succès du cache média', lambda: media_cache.hits)
+metrics.Gauge('bot_media_cache_misses', 'Échecs du cache média', lambda: media_cache.misses)
+
+
+class Music(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self._preload_task = None
+        self._restore_task = None
+
+    async def cog_load(self):
+        if MUSIC_PRELOAD:
+            self._preload_task = asyncio.create_task(extraction_pool.preload())
+        self._restore_task = asyncio.create_task(self.restore_sessions())
+
+    async def cog_unload(self):
+        if self._preload_task is not None:
+            self._preload_task.cancel()
+        if self._restore_task is not None:
+            self._restore_task.cancel()
+        loudness_analyzer.shutdown()
+
+    def save_sessions(self):
+        # Arrêt du bot (voir main.py) : état des lecteurs sauvegardé avant la déconnexion
+        return save_sessions()
+
+    def shutdown(self):
+        # Arrêt du bot : les index et les gains sont écrits tout de suite. Les hooks atexit
+        # ne passent qu'après l'attente des pools, qu'une analyse ffmpeg en cours peut
+        # prolonger au-delà du délai de grâce de la plateforme
+        media_cache.save()
+        audio_cache.save()
+        extraction_pool.shutdown()
+        loudness_analyzer.shutdown()
+
+    async def restore_sessions(self):
+        # Reprend les lectures interrompues par le dernier arrêt, à la position sauvegardée
+        sessions = load_sessions()
+        if not sessions:
+            return
+        await self.bot.wait_until_ready()
+        restored = 0
+        for session in sessions:
+            guild = self.bot.get_guild(session['g'])
+            channel = guild and guild.get_channel(session['v'])
+            if channel is None:
+                continue
+            player = get_player(guild)
+            player.text_channel = guild.get_channel(session['t']) if session['t'] else None
+            try:
+                await player.connect(channel)
+            except Exception as e:
+                logger.error("Reprise de la session musicale du serveur %s impossible : %s", guild.id, e)
+                await player.stop()
+                continue
+            player.restore(session)
+            restored += 1
+        logger.info("%s/%s session(s) musicale(s) reprise(s)", restored, len(sessions))
+
+    # Musique avec gestion robuste des erreurs
+    @commands.command(name='play')
+    async def play(self, ctx, *, url: str):
+        logger.info("Commande !play exécutée avec URL : %s", url)
+        if not ctx.author.voice:
+            await ctx.send("Rejoins un salon vocal d'abord !")
+            return
+
+        channel = ctx.author.voice.channel
+        permissions = channel.permissions_for(ctx.guild.me)
+        if not permissions.connect or not permissions.speak:
+            await ctx.send("Je n'ai pas les permissions pour rejoindre ou parler dans ce salon vocal.")
+            return
+
+        player = get_player(ctx.guild)
+        player.text_channel = ctx.channel
+        try:
+            await player.connect(channel)
+        except Exception as e:
+            await player.stop()
+            await ctx.send(f"Échec de la connexion au salon vocal après {VOICE_CONNECT_ATTEMPTS} tentatives : {str(e)}")
+            return
+        # Lecteur en pause : la file n'avancerait plus, le morceau en cours reprend
+        if player.resume():
+            await ctx.send("Lecture reprise.")
+
+        if is_playlist_query(url):
+            if player.loader is not None and not player.loader.done():
+                await ctx.send("Une playlist est déjà en cours d'ajout, patiente un instant.")
+                return
+            player.loader = asyncio.create_task(self._load_playlist(ctx, player, url))
+            return
+
+        track = Track(url, requested_by=ctx.author)
+        if player.active:
+            await ctx.send(f"Ajouté à la file (position {len(player.queue) + 1}) : **{url}**")
+        player.enqueue(track)
+
+    async def _load_playlist(self, ctx, player, url):
+        try:
+            title, count = await player.enqueue_playlist(url, requested_by=ctx.author)
+        except ExtractionBusy:
+            await ctx.send("Trop de demandes de musique en cours. Réessayez dans un instant.")
+        except Exception as e:
+            logger.error("Erreur lors de la lecture de la playlist %s : %s", url, e)
+            await ctx.send(f"Erreur lors de la lecture de la playlist : {str(e)}")
+        else:
+            if not count:
+                await ctx.send("Aucun morceau trouvé.")
+            elif not player.stopped:
+                await ctx.send(f"Playlist **{title or url}** : {count} morceau(x) ajouté(s) à la file.")
+        finally:
+            # Rien n'a pu être ajouté : la session vocale n'est gardée que le délai de grâce
+            if not player.active and not player.stopped:
+                player.schedule_idle()
+
+    @commands.command(name='pause')
+    async def pause(self, ctx):
+        logger.info("Commande !pause exécutée")
+        player = players.get(ctx.guild.id)
+        if player and player.pause():
+            await ctx.send("Musique en pause.")
+        else:
+            await ctx.send("Aucune musique en cours.")
+
+    @commands.command(name='resume')
+    async def resume(self, ctx):
+        logger.info("Commande !resume exécutée")
+        player = players.get(ctx.guild.id)
+        if player and player.resume():
+            await ctx.send("Lecture reprise.")
+        else:
+            await ctx.send("Aucune musique en pause.")
+
+    @commands.command(name='stop')
+    async def stop(self, ctx):
+        logger.info("Commande !stop exécutée")
+        player = players.get(ctx.guild.id)
+        if player:
+            await player.stop()
+            await ctx.send("Musique arrêtée et déconnexion.")
+        elif ctx.guild.voice_client:
+            await ctx.guild.voice_client.disconnect(force=True)
+            await ctx.send("Musique arrêtée et déconnexion.")
+        else:
+            await ctx.send("Pas connecté à un salon vocal.")
+
+    @commands.command(name='skip')
+    async def skip(self, ctx):
+        logger.info("Commande !skip exécutée")
+        player = players.get(ctx.guild.id)
+        if player and player.skip():
+            await ctx.send("Musique passée.")
+        else:
+            await ctx.send("Aucune musique à passer.")
+
+    @commands.command(name='queue')
+    async def show_queue(self, ctx):
+        logger.info("Commande !queue exécutée")
+        player = players.get(ctx.guild.id)
+        if not player or (player.current is None and not player.queue):
+            await ctx.send("La file est vide.")
+            return
+        lines = []
+        if player.current:
+            lines.append(f"En cours : **{player.current.title}**")
+        for i, track in enumerate(list(player.queue)[:10], start=1):
+            lines.append(f"{i}. {track.title}")
+        if len(player.queue) > 10:
+            lines.append(f"... et {len(player.queue) - 10} autre(s)")
+        await ctx.send("\n".join(lines))
+
+
+async def setup(bot):
+    await bot.add_cog(Music(bot))
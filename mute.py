@@ -0,0 +1,189 @@
+import asyncio
+import heapq
+import logging
+import os
+import re
+import time
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+MUTE_ROLE_NAME = "Muted"
+MUTE_CONCURRENCY = int(os.getenv('MUTE_CONCURRENCY', '5'))
+MUTE_MAX_RETRIES = 3
+UNMUTE_RETRY_DELAY = 60  # secondes avant de réessayer un démute échoué
+PROGRESS_EVERY = 25
+
+_DURATION = re.compile(r'^(\d+)\s*([smhdj])$', re.IGNORECASE)
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'j': 86400}
+
+
+def parse_duration(text):
+    # "30s", "10m", "2h", "1d" (ou "1j") -> secondes, None si invalide
+    match = _DURATION.match(text.strip())
+    if not match:
+        return None
+    return int(match.group(1)) * _UNITS[match.group(2).lower()]
+
+
+def _is_muted_in(channel, role):
+    return channel.overwrites_for(role).send_messages is False
+
+
+async def _apply(channel, role, sync):
+    # discord.py attend déjà la fin des buckets de rate-limit par route ;
+    # on ne réessaie ici que si un 429 remonte malgré tout
+    for attempt in range(MUTE_MAX_RETRIES):
+        try:
+            if sync:
+                # Salon synchronisé avec sa catégorie : on le resynchronise pour qu'il reste aligné
+                await channel.edit(sync_permissions=True, reason="Configuration du rôle Muted")
+            else:
+                await channel.set_permissions(role, send_messages=False, reason="Configuration du rôle Muted")
+            return True
+        except discord.HTTPException as e:
+            if e.status != 429 or attempt == MUTE_MAX_RETRIES - 1:
+                logger.error("Impossible de configurer %s : %s", channel, e)
+                return False
+            await asyncio.sleep(2 ** attempt)
+
+
+_setup_locks = {}
+
+
+async def ensure_mute_overwrites(guild, role, progress=None):
+    # Applique l'interdiction d'écrire sur tous les salons, catégories d'abord.
+    # Les salons déjà configurés sont ignorés : une configuration interrompue
+    # reprend là où elle s'était arrêtée au prochain !mute.
+    lock = _setup_locks.setdefault(guild.id, asyncio.Lock())
+    async with lock:
+        categories = [c for c in guild.categories if not _is_muted_in(c, role)]
+        channels = [c for c in guild.channels
+                    if not isinstance(c, discord.CategoryChannel) and not _is_muted_in(c, role)]
+        total = len(categories) + len(channels)
+        if not total:
+            return 0, 0
+        # Mémorisé avant de modifier les catégories, sinon tout paraîtrait désynchronisé
+        synced = {c.id for c in channels if c.category and c.permissions_synced}
+        semaphore = asyncio.Semaphore(MUTE_CONCURRENCY)
+        done = 0
+        failed = 0
+        configured = set()
+
+        async def run(channel, sync=False):
+            nonlocal done, failed
+            async with semaphore:
+                if await _apply(channel, role, sync):
+                    configured.add(channel.id)
+                else:
+                    failed += 1
+                done += 1
+                if progress and (done % PROGRESS_EVERY == 0 or done == total):
+                    await progress(done, total)
+
+        await asyncio.gather(*(run(c) for c in categories))
+        await asyncio.gather(*(run(c, sync=c.id in synced and c.category_id in configured) for c in channels))
+        logger.info("Rôle Muted configuré sur %s salon(s) de %s (%s échec(s))", done - failed, guild, failed)
+        return done - failed, failed
+
+
+async def get_mute_role(guild):
+    role = discord.utils.get(guild.roles, name=MUTE_ROLE_NAME)
+    if role is None:
+        role = await guild.create_role(name=MUTE_ROLE_NAME)
+    return role
+
+
+class MuteScheduler:
+    # Démutes planifiés dans un tas : une seule tâche dort jusqu'à la prochaine échéance
+
+    def __init__(self, bot, backend):
+        self.bot = bot
+        self.backend = backend
+        self._heap = []  # (échéance, guild_id, user_id)
+        self._deadlines = {}  # (guild_id, user_id) -> échéance en vigueur
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _load(self):
+        # Après on_ready : le cache des serveurs permet de ne garder que ceux de ce
+        # processus (en cluster, les autres workers s'occupent des leurs)
+        rows = await asyncio.get_running_loop().run_in_executor(None, self.backend.timed_mutes)
+        for guild_id, user_id, until in rows:
+            if self.bot.get_guild(guild_id) is not None and (guild_id, user_id) not in self._deadlines:
+                self._push(guild_id, user_id, until)
+
+    def _push(self, guild_id, user_id, until):
+        self._deadlines[(guild_id, user_id)] = until
+        heapq.heappush(self._heap, (until, guild_id, user_id))
+        self._wakeup.set()
+
+    def schedule(self, guild_id, user_id, seconds):
+        until = time.time() + seconds
+        self._push(guild_id, user_id, until)
+        self.backend.add_timed_mute(guild_id, user_id, until)
+        return until
+
+    def cancel(self, guild_id, user_id):
+        # Suppression paresseuse : l'entrée du tas est ignorée à son échéance
+        if self._deadlines.pop((guild_id, user_id), None) is not None:
+            self.backend.remove_timed_mute(guild_id, user_id)
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        await self._load()
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            until, guild_id, user_id = self._heap[0]
+            delay = until - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            key = (guild_id, user_id)
+            if self._deadlines.get(key) != until:
+                continue
+            try:
+                done = await self._unmute(guild_id, user_id)
+            except Exception as e:
+                logger.error("Erreur lors du démute automatique de %s : %s", user_id, e)
+                if self._deadlines.get(key) == until:
+                    # Entrée gardée en base : nouvel essai plus tard
+                    self._push(guild_id, user_id, time.time() + UNMUTE_RETRY_DELAY)
+                continue
+            if self._deadlines.get(key) != until:
+                # Remuté pendant le démute : la nouvelle échéance est conservée
+                continue
+            if done:
+                self.cancel(guild_id, user_id)
+            else:
+                # Serveur absent de ce processus : l'entrée reste en base pour celui qui le gère
+                del self._deadlines[key]
+
+    async def _unmute(self, guild_id, user_id):
+        # True une fois le mute levé (ou sans objet), False si le serveur n'est pas géré ici
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return False
+        role = discord.utils.get(guild.roles, name=MUTE_ROLE_NAME)
+        if role is None:
+            return True
+        try:
+            member = guild.get_member(user_id) or await guild.fetch_member(user_id)
+        except discord.NotFound:
+            # Le membre a quitté le serveur
+            return True
+        await member.remove_roles(role, reason="Fin du mute temporaire")
+        logger.info("%s démuté automatiquement sur %s", member, guild)
+        return True
@@ -0,0 +1,147 @@
+import asyncio
+import datetime
+import logging
+import os
+import re
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+PURGE_MAX = int(os.getenv('PURGE_MAX', '10000'))
+PURGE_MAX_SCAN = int(os.getenv('PURGE_MAX_SCAN', '50000'))
+BULK_SIZE = 100
+# Discord refuse la suppression groupée des messages de plus de 14 jours (marge d'une minute)
+BULK_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=1)
+
+
+class PurgeFilter:
+    def __init__(self, authors=(), bots_only=False, attachments_only=False, pattern=None):
+        self.authors = {author.id for author in authors}
+        self.bots_only = bots_only
+        self.attachments_only = attachments_only
+        self.regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+
+    @classmethod
+    def parse(cls, options, mentions=()):
+        # "@user bots fichiers regex:<motif>" (le motif va jusqu'à la fin de la ligne)
+        pattern = None
+        if 'regex:' in options:
+            options, pattern = options.split('regex:', 1)
+            pattern = pattern.strip() or None
+        words = options.lower().split()
+        return cls(
+            authors=mentions,
+            bots_only='bots' in words,
+            attachments_only='fichiers' in words or 'attachments' in words,
+            pattern=pattern,
+        )
+
+    def __call__(self, message):
+        if message.pinned:
+            return False
+        if self.authors and message.author.id not in self.authors:
+            return False
+        if self.bots_only and not message.author.bot:
+            return False
+        if self.attachments_only and not message.attachments:
+            return False
+        if self.regex and not self.regex.search(message.content):
+            return False
+        return True
+
+
+class PurgeJob:
+    # Parcourt l'historique à la demande : suppression groupée par 100 pour les
+    # messages récents, suppression unitaire (à la suite) pour les plus anciens.
+
+    def __init__(self, channel, amount, check, before=None, progress=None):
+        self.channel = channel
+        self.amount = amount
+        self.check = check
+        self.before = before
+        self.progress = progress
+        self.deleted = 0
+        self.scanned = 0
+        self.failed = 0
+        self._cancelled = asyncio.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    async def _bulk_delete(self, batch):
+        try:
+            if len(batch) == 1:
+                await batch[0].delete()
+            else:
+                await self.channel.delete_messages(batch)
+            self.deleted += len(batch)
+        except discord.NotFound:
+            # Déjà supprimés par quelqu'un d'autre
+            self.deleted += len(batch)
+        except discord.HTTPException as e:
+            logger.error("Suppression groupée échouée dans %s : %s", self.channel, e)
+            self.failed += len(batch)
+        await self._report()
+
+    async def _single_delete(self, message):
+        try:
+            await message.delete()
+            self.deleted += 1
+        except discord.NotFound:
+            self.deleted += 1
+        except discord.HTTPException as e:
+            logger.error("Suppression du message %s échouée : %s", message.id, e)
+            self.failed += 1
+        if self.deleted % 10 == 0:
+            await self._report()
+
+    async def _report(self, final=False):
+        if self.progress:
+            try:
+                await self.progress(self, final)
+            except discord.HTTPException as e:
+                logger.error("Impossible de mettre à jour la progression : %s", e)
+
+    async def run(self):
+        if self.amount < 1:
+            # La limite n'est vérifiée qu'après un premier message : rien à supprimer
+            return 0
+        batch = []
+        old_messages = []
+        matched = 0
+        bulk_limit = discord.utils.utcnow() - BULK_MAX_AGE
+        async for message in self.channel.history(limit=PURGE_MAX_SCAN, before=self.before):
+            if self.cancelled:
+                break
+            self.scanned += 1
+            if not self.check(message):
+                continue
+            matched += 1
+            if message.created_at > bulk_limit:
+                batch.append(message)
+                if len(batch) == BULK_SIZE:
+                    await self._bulk_delete(batch)
+                    batch = []
+            else:
+                # L'historique va du plus récent au plus ancien : tout le reste est ancien
+                old_messages.append(message)
+            if matched >= self.amount:
+                break
+        if batch and not self.cancelled:
+            await self._bulk_delete(batch)
+        for message in old_messages:
+            if self.cancelled:
+                break
+            await self._single_delete(message)
+        await self._report(final=True)
+        logger.info("Purge de %s : %s supprimé(s), %s analysé(s), %s échec(s)%s", self.channel, self.deleted,
+                    self.scanned, self.failed, " (annulée)" if self.cancelled else "")
+        return self.deleted
+
+
+jobs = {}  # channel_id -> PurgeJob en cours
@@ -0,0 +1,196 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import math
+import os
+import time
+
+import metrics
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT', '1') == '1'
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv('RATE_LIMIT_MAX_BUCKETS', '50000'))
+RATE_LIMIT_NOTICE_INTERVAL = float(os.getenv('RATE_LIMIT_NOTICE_INTERVAL', '30'))
+ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', '4'))
+ADMISSION_MAX_WAITING = int(os.getenv('ADMISSION_MAX_WAITING', '100'))
+
+# Classes de coût : seaux (capacité, jetons par seconde) par utilisateur et par serveur
+COST_CLASSES = {
+    'cheap': {'user': (8, 1.0), 'guild': (60, 10.0)},
+    'unknown': {'user': (3, 0.2), 'guild': (20, 2.0)},  # réponse "commande non trouvée"
+    'write': {'user': (3, 0.1), 'guild': (15, 0.5)},  # écriture du stockage
+    'heavy': {'user': (3, 0.1), 'guild': (10, 0.3)},  # extraction yt-dlp, purge, configuration
+}
+
+# Unités de travail soumises à l'admission et leur coût (les moins coûteuses passent
+# d'abord). Les purges et la configuration du rôle Muted n'y passent pas : longues
+# et limitées par Discord, elles ont leurs propres bornes par salon et par serveur.
+WORK_COSTS = {
+    'extract': 5,  # résolution d'une piste par yt-dlp
+    'playlist': 8,  # page d'une playlist ou d'une recherche multiple
+}
+
+# Commandes hors classe "cheap"
+COMMAND_COSTS = {
+    'play': 'heavy',
+    'clear': 'heavy',
+    'mute': 'heavy',
+    'addcmd': 'write',
+    'addbanned': 'write',
+    'removebanned': 'write',
+    'changeurl': 'write',
+    'unmute': 'write',
+}
+
+rejected = metrics.Counter('bot_ratelimit_rejected_total', 'Requêtes refusées par le limiteur', ('class', 'scope'))
+admission_wait = metrics.Histogram('bot_admission_wait_seconds', "Attente avant l'admission d'une unité de travail",
+                                   ('kind',))
+
+
+def cost_class(command_name):
+    return COMMAND_COSTS.get(command_name, 'cheap')
+
+
+def format_retry(seconds):
+    return f"{max(1, math.ceil(seconds))} s"
+
+
+class RateLimiter:
+    # Seaux à jetons dans un OrderedDict (du moins au plus récemment utilisé).
+    # Un seau inactif assez longtemps pour être de nouveau plein équivaut à
+    # un seau absent : il est supprimé, la mémoire reste bornée.
+
+    def __init__(self, classes=COST_CLASSES, max_buckets=RATE_LIMIT_MAX_BUCKETS,
+                 notice_interval=RATE_LIMIT_NOTICE_INTERVAL):
+        self.classes = classes
+        self.max_buckets = max_buckets
+        self.notice_interval = notice_interval
+        self._buckets = collections.OrderedDict()  # (classe, portée, id) -> [jetons, dernière mise à jour, plein après]
+        self._notices = collections.OrderedDict()  # user_id -> date du dernier avertissement
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if bucket[2] > now and len(buckets) <= self.max_buckets:
+                break
+            del buckets[key]
+            self.evictions += 1
+
+    def _take(self, key, capacity, rate, cost, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = capacity
+        else:
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        if tokens < cost:
+            return (cost - tokens) / rate
+        tokens -= cost
+        if bucket is None:
+            bucket = self._buckets[key] = [tokens, now, 0.0]
+        else:
+            bucket[0] = tokens
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        bucket[2] = now + (capacity - tokens) / rate
+        return 0.0
+
+    def check(self, kind, user_id, guild_id=None):
+        # Renvoie 0 si la requête est admise, sinon le délai (en secondes) avant de réessayer
+        if not RATE_LIMIT_ENABLED:
+            return 0.0
+        now = time.monotonic()
+        self._evict(now)
+        settings = self.classes[kind]
+        cost = 1
+        # Seau du serveur vérifié sans consommer d'abord : un refus utilisateur ne le vide pas
+        if guild_id is not None:
+            capacity, rate = settings['guild']
+            bucket = self._buckets.get((kind, 'guild', guild_id))
+            tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            if tokens < cost:
+                rejected.inc(kind, 'guild')
+                return (cost - tokens) / rate
+        capacity, rate = settings['user']
+        retry_after = self._take((kind, 'user', user_id), capacity, rate, cost, now)
+        if retry_after:
+            rejected.inc(kind, 'user')
+            return retry_after
+        if guild_id is not None:
+            capacity, rate = settings['guild']
+            self._take((kind, 'guild', guild_id), capacity, rate, cost, now)
+        return 0.0
+
+    def should_notify(self, user_id):
+        # Un seul avertissement par utilisateur et par intervalle : les autres refus sont silencieux
+        now = time.monotonic()
+        last = self._notices.get(user_id)
+        if last is not None and now - last < self.notice_interval:
+            return False
+        self._notices[user_id] = now
+        self._notices.move_to_end(user_id)
+        while len(self._notices) > self.max_buckets or (
+                self._notices and now - next(iter(self._notices.values())) >= self.notice_interval):
+            self._notices.popitem(last=False)
+        return True
+
+
+class AdmissionQueue:
+    # Nombre borné d'unités de travail coûteuses en cours (une extraction, pas
+    # une commande entière) ; en cas d'attente, les moins coûteuses passent
+    # d'abord (puis par ordre d'arrivée)
+
+    def __init__(self, concurrency=ADMISSION_CONCURRENCY, max_waiting=ADMISSION_MAX_WAITING):
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.running = 0
+        self._waiting = []  # tas de (coût, ordre, future)
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    def full(self):
+        return self.running >= self.concurrency and len(self._waiting) >= self.max_waiting
+
+    async def acquire(self, kind):
+        if self.running < self.concurrency and not self._waiting:
+            self.running += 1
+            admission_wait.observe(0.0, kind)
+            return
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        entry = (WORK_COSTS[kind], next(self._counter), future)
+        heapq.heappush(self._waiting, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Place déjà attribuée : on la rend
+                self.release()
+            elif entry in self._waiting:
+                # Sinon l'entrée a pu être retirée entre-temps par release(), qui l'a ignorée
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+            raise
+        admission_wait.observe(time.monotonic() - start, kind)
+
+    def release(self):
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+
+limiter = RateLimiter()
+admission = AdmissionQueue()
+
+metrics.Gauge('bot_ratelimit_buckets', 'Seaux à jetons en mémoire', lambda: len(limiter))
+metrics.Gauge('bot_admission_waiting', "Unités de travail en attente d'admission", lambda: admission.waiting)
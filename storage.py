@@ -0,0 +1,398 @@
+import atexit
+import collections
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
+STORAGE_DB = os.getenv('STORAGE_DB', 'data.db')
+STORAGE_FLUSH_INTERVAL = float(os.getenv('STORAGE_FLUSH_INTERVAL', '5'))
+STORAGE_GUILD_CACHE = int(os.getenv('STORAGE_GUILD_CACHE', '256'))
+
+DEFAULT_URL = 'https://example.com'
+# Données héritées de data.json (globales) importées sous ce guild_id. Les
+# réglages (sans l'XP) ne sont recopiés que dans les serveurs où le bot était
+# déjà présent lors de la migration (voir seed_legacy)
+LEGACY_GUILD_ID = 0
+
+
+def default_guild_data():
+    return {'custom_cmds': {}, 'banned_words': [], 'url': DEFAULT_URL}
+
+
+class StorageBackend:
+    # Interface commune des backends de stockage
+
+    def load_guild(self, guild_id):
+        raise NotImplementedError
+
+    def seed_legacy(self, guilds):
+        raise NotImplementedError
+
+    def set_url(self, guild_id, url):
+        raise NotImplementedError
+
+    def set_custom_cmd(self, guild_id, name, response):
+        raise NotImplementedError
+
+    def add_banned_word(self, guild_id, word):
+        raise NotImplementedError
+
+    def remove_banned_word(self, guild_id, word):
+        raise NotImplementedError
+
+    def get_member(self, guild_id, user_id):
+        raise NotImplementedError
+
+    def write_members(self, rows):
+        raise NotImplementedError
+
+    def guild_members(self, guild_id):
+        raise NotImplementedError
+
+    def timed_mutes(self):
+        raise NotImplementedError
+
+    def add_timed_mute(self, guild_id, user_id, until):
+        raise NotImplementedError
+
+    def remove_timed_mute(self, guild_id, user_id):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS guild_settings (
+    guild_id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS custom_cmds (
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    response TEXT NOT NULL,
+    PRIMARY KEY (guild_id, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS banned_words (
+    guild_id INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    PRIMARY KEY (guild_id, word)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS members (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    xp INTEGER NOT NULL DEFAULT 0,
+    level INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS members_by_xp ON members (guild_id, xp DESC);
+CREATE TABLE IF NOT EXISTS timed_mutes (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    until REAL NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteBackend(StorageBackend):
+    # Lectures indexées à la demande ; écritures différées, regroupées
+    # dans une seule transaction par un thread d'arrière-plan. Les lectures
+    # passent par une seconde connexion (WAL : jamais bloquée par l'écriture)
+    # et voient les écritures en attente sans forcer de flush.
+
+    def __init__(self, path=STORAGE_DB, flush_interval=STORAGE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._db_lock = threading.Lock()
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._pending = []  # (sql, paramètres)
+        self._pending_lock = threading.Lock()
+        # Écritures pas encore visibles en base, en attente puis en cours de flush
+        self._members_pending = {}  # (guild_id, user_id) -> (xp, level)
+        self._members_flushing = {}
+        self._guilds_pending = set()  # serveurs dont les réglages ont des écritures en attente
+        self._guilds_flushing = set()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='storage-flush', daemon=True)
+        self._thread.start()
+        self.flushes = 0
+        atexit.register(self.close)
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def _write(self, sql, params, guild_id=None):
+        with self._pending_lock:
+            self._pending.append((sql, params))
+            if guild_id is not None:
+                self._guilds_pending.add(guild_id)
+
+    def _pending_member(self, key):
+        with self._pending_lock:
+            return self._members_pending.get(key) or self._members_flushing.get(key)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        # Un seul flush à la fois, pour conserver l'ordre des écritures
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+                self._members_flushing, self._members_pending = self._members_pending, {}
+                self._guilds_flushing, self._guilds_pending = self._guilds_pending, set()
+            if not pending:
+                return
+            try:
+                with self._db_lock, self._conn:
+                    for sql, params in pending:
+                        self._conn.execute(sql, params)
+                self.flushes += 1
+                logger.info("%s modification(s) enregistrée(s) dans %s", len(pending), self.path)
+            except Exception as e:
+                # On remet les écritures en tête de file pour réessayer au prochain cycle
+                with self._pending_lock:
+                    self._pending[:0] = pending
+                    self._members_pending = {**self._members_flushing, **self._members_pending}
+                    self._guilds_pending |= self._guilds_flushing
+                logger.error("Erreur lors de l'enregistrement dans %s: %s", self.path, e)
+            finally:
+                with self._pending_lock:
+                    self._members_flushing = {}
+                    self._guilds_flushing = set()
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+        with self._read_lock:
+            self._reader.close()
+
+    def seed_legacy(self, guilds):
+        # guilds : (guild_id, date d'arrivée du bot en timestamp). Recopie l'URL, les
+        # commandes et les mots interdits globaux (jamais l'XP) dans les serveurs rejoints
+        # avant la migration de data.json et encore sans réglages. Renvoie les serveurs modifiés.
+        migrated_at = self.get_meta('migrated_at')
+        if migrated_at is None:
+            return []
+        self.flush()
+        seeded = []
+        with self._db_lock, self._conn:
+            legacy = self._conn.execute(
+                'SELECT url FROM guild_settings WHERE guild_id = ?', (LEGACY_GUILD_ID,)).fetchone()
+            if not legacy:
+                return []
+            for guild_id, joined_at in guilds:
+                if joined_at is None or joined_at > float(migrated_at):
+                    continue
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO guild_settings (guild_id, url) VALUES (?, ?)', (guild_id, legacy[0]))
+                if not cursor.rowcount:
+                    continue
+                self._conn.execute(
+                    'INSERT OR IGNORE INTO custom_cmds SELECT ?, name, response FROM custom_cmds WHERE guild_id = ?',
+                    (guild_id, LEGACY_GUILD_ID))
+                self._conn.execute(
+                    'INSERT OR IGNORE INTO banned_words SELECT ?, word FROM banned_words WHERE guild_id = ?',
+                    (guild_id, LEGACY_GUILD_ID))
+                seeded.append(guild_id)
+        if seeded:
+            logger.info("Réglages de data.json recopiés dans %s serveur(s)", len(seeded))
+        return seeded
+
+    def load_guild(self, guild_id):
+        # Serveur évincé puis relu avant l'enregistrement de ses réglages (rare) :
+        # seul cas où la lecture attend un flush
+        with self._pending_lock:
+            dirty = guild_id in self._guilds_pending or guild_id in self._guilds_flushing
+        if dirty:
+            self.flush()
+        guild = default_guild_data()
+        row = self._query('SELECT url FROM guild_settings WHERE guild_id = ?', (guild_id,))
+        if row:
+            guild['url'] = row[0][0]
+        guild['custom_cmds'] = dict(self._query(
+            'SELECT name, response FROM custom_cmds WHERE guild_id = ?', (guild_id,)))
+        guild['banned_words'] = [word for (word,) in self._query(
+            'SELECT word FROM banned_words WHERE guild_id = ?', (guild_id,))]
+        return guild
+
+    def set_url(self, guild_id, url):
+        self._write('INSERT INTO guild_settings (guild_id, url) VALUES (?, ?) '
+                    'ON CONFLICT (guild_id) DO UPDATE SET url = excluded.url', (guild_id, url), guild_id)
+
+    def set_custom_cmd(self, guild_id, name, response):
+        self._write('INSERT OR REPLACE INTO custom_cmds (guild_id, name, response) VALUES (?, ?, ?)',
+                    (guild_id, name, response), guild_id)
+
+    def add_banned_word(self, guild_id, word):
+        self._write('INSERT OR IGNORE INTO banned_words (guild_id, word) VALUES (?, ?)', (guild_id, word), guild_id)
+
+    def remove_banned_word(self, guild_id, word):
+        self._write('DELETE FROM banned_words WHERE guild_id = ? AND word = ?', (guild_id, word), guild_id)
+
+    def get_member(self, guild_id, user_id):
+        pending = self._pending_member((guild_id, user_id))
+        if pending is not None:
+            return pending
+        row = self._query('SELECT xp, level FROM members WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+        return row[0] if row else (0, 0)
+
+    def write_members(self, rows):
+        # rows : itérable de (guild_id, user_id, xp, level)
+        with self._pending_lock:
+            for row in rows:
+                self._pending.append(('INSERT OR REPLACE INTO members (guild_id, user_id, xp, level) VALUES (?, ?, ?, ?)',
+                                      row))
+                self._members_pending[(row[0], row[1])] = (row[2], row[3])
+
+    def guild_members(self, guild_id):
+        # (user_id, xp, level) de tous les membres classés du serveur. Lecture longue :
+        # à appeler hors de la boucle asyncio (elle attend un éventuel flush en cours)
+        with self._flush_lock:
+            members = {user_id: (user_id, xp, level) for user_id, xp, level in self._query(
+                'SELECT user_id, xp, level FROM members WHERE guild_id = ?', (guild_id,))}
+            with self._pending_lock:
+                for (member_guild, user_id), (xp, level) in self._members_pending.items():
+                    if member_guild == guild_id:
+                        members[user_id] = (user_id, xp, level)
+        return list(members.values())
+
+    def timed_mutes(self):
+        self.flush()
+        return self._query('SELECT guild_id, user_id, until FROM timed_mutes')
+
+    def add_timed_mute(self, guild_id, user_id, until):
+        self._write('INSERT OR REPLACE INTO timed_mutes (guild_id, user_id, until) VALUES (?, ?, ?)',
+                    (guild_id, user_id, until))
+
+    def remove_timed_mute(self, guild_id, user_id):
+        self._write('DELETE FROM timed_mutes WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+
+    def get_meta(self, key):
+        row = self._query('SELECT value FROM meta WHERE key = ?', (key,))
+        return row[0][0] if row else None
+
+    def set_meta(self, key, value):
+        self._write('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+
+class GuildCache:
+    # Cache LRU borné des données par serveur, chargées à la première utilisation
+
+    def __init__(self, backend, max_guilds=STORAGE_GUILD_CACHE):
+        self.backend = backend
+        self.max_guilds = max_guilds
+        self._guilds = collections.OrderedDict()
+
+    def get(self, guild_id):
+        guild = self._guilds.get(guild_id)
+        if guild is None:
+            guild = self._guilds[guild_id] = self.backend.load_guild(guild_id)
+            while len(self._guilds) > self.max_guilds:
+                self._guilds.popitem(last=False)
+        else:
+            self._guilds.move_to_end(guild_id)
+        return guild
+
+    def __len__(self):
+        return len(self._guilds)
+
+    def invalidate(self, guild_id):
+        # Données modifiées par un autre processus : rechargées au prochain accès
+        self._guilds.pop(guild_id, None)
+
+    def set_url(self, guild_id, url):
+        self.get(guild_id)['url'] = url
+        self.backend.set_url(guild_id, url)
+
+    def set_custom_cmd(self, guild_id, name, response):
+        self.get(guild_id)['custom_cmds'][name] = response
+        self.backend.set_custom_cmd(guild_id, name, response)
+
+    def add_banned_word(self, guild_id, word):
+        words = self.get(guild_id)['banned_words']
+        if word in words:
+            return False
+        words.append(word)
+        self.backend.add_banned_word(guild_id, word)
+        return True
+
+    def remove_banned_word(self, guild_id, word):
+        words = self.get(guild_id)['banned_words']
+        if word not in words:
+            return False
+        words.remove(word)
+        self.backend.remove_banned_word(guild_id, word)
+        return True
+
+
+def migrate_json(json_path, backend, guild_id=LEGACY_GUILD_ID):
+    # Import unique de l'ancien data.json (données globales, non partitionnées)
+    with open(json_path, 'r', encoding='utf-8') as f:
+        legacy = json.load(f)
+    backend.set_url(guild_id, legacy.get('url') or DEFAULT_URL)
+    for name, response in legacy.get('custom_cmds', {}).items():
+        backend.set_custom_cmd(guild_id, name.lower(), response)
+    for word in legacy.get('banned_words', []):
+        if word:
+            backend.add_banned_word(guild_id, word.lower())
+    levels = legacy.get('levels', {})
+    backend.write_members(
+        (guild_id, int(user_id), int(xp), int(levels.get(user_id, 0)))
+        for user_id, xp in legacy.get('xp', {}).items())
+    backend.set_meta('migrated_json', json_path)
+    if guild_id == LEGACY_GUILD_ID:
+        backend.set_meta('migrated_at', str(time.time()))
+    backend.flush()
+    logger.info("%s migré dans le stockage (guild_id %s)", json_path, guild_id)
+
+
+def open_storage(legacy_json=None):
+    if STORAGE_BACKEND != 'sqlite':
+        raise ValueError(f"Backend de stockage inconnu : {STORAGE_BACKEND}")
+    backend = SQLiteBackend()
+    if legacy_json and os.path.exists(legacy_json) and backend.get_meta('migrated_json') is None:
+        try:
+            migrate_json(legacy_json, backend)
+        except Exception as e:
+            logger.error("Erreur lors de la migration de %s: %s", legacy_json, e)
+    return backend
+
+
+if __name__ == '__main__':
+    # Migration manuelle : python storage.py data.json [guild_id]
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    if len(sys.argv) < 2:
+        print("Usage : python storage.py <data.json> [guild_id]")
+        sys.exit(1)
+    target = int(sys.argv[2]) if len(sys.argv) > 2 else LEGACY_GUILD_ID
+    sqlite_backend = SQLiteBackend()
+    migrate_json(sys.argv[1], sqlite_backend, target)
+    sqlite_backend.close()
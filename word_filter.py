@@ -0,0 +1,178 @@
+import collections
+import os
+import unicodedata
+
+# Configuration du filtre (variables d'environnement)
+FILTER_NORMALIZE = os.getenv('FILTER_NORMALIZE', '1') == '1'  # ignore accents et variantes Unicode
+FILTER_MODE = os.getenv('FILTER_MODE', 'word')  # 'word' (mots entiers) ou 'substring'
+
+
+def normalize(text, strip_accents=FILTER_NORMALIZE):
+    if strip_accents:
+        # NFKD sépare les accents et ramène les variantes (ｆｕｌｌwidth, ligatures...) à leur forme simple
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return text.casefold()
+
+
+class WordFilter:
+    # Automate d'Aho-Corasick : une seule passe sur le message, quel que soit
+    # le nombre de mots interdits. Construit en entier une fois ; ensuite, un
+    # ajout ou une suppression ne met à jour que les liens touchés par le mot
+    # (noeuds dont la chaîne d'échec passe par lui), sans reconstruction.
+
+    def __init__(self, words=(), mode=FILTER_MODE, strip_accents=FILTER_NORMALIZE):
+        self.mode = mode
+        self.strip_accents = strip_accents
+        self._goto = [{}]     # noeud -> {caractère: noeud}
+        self._length = [0]    # longueur du mot terminé sur ce noeud (0 si aucun)
+        self._fail = [0]
+        self._output = [-1]   # noeud terminal le plus proche sur la chaîne d'échec
+        self._fail_children = {}  # noeud -> noeuds dont le lien d'échec pointe vers lui
+        self._words = {}      # mot normalisé -> mot d'origine
+        for word in words:
+            key = normalize(word, self.strip_accents).strip()
+            if key and key not in self._words:
+                self._insert(key)
+                self._words[key] = word
+        self._build_links()
+
+    def __len__(self):
+        return len(self._words)
+
+    def __contains__(self, word):
+        return normalize(word, self.strip_accents).strip() in self._words
+
+    def _insert(self, key):
+        # Ajoute le mot au trie ; renvoie son noeud terminal et les (parent, caractère, noeud) créés
+        created = []
+        node = 0
+        for char in key:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._length.append(0)
+                self._fail.append(0)
+                self._output.append(-1)
+                created.append((node, char, nxt))
+            node = nxt
+        self._length[node] = len(key)
+        return node, created
+
+    def add(self, word):
+        key = normalize(word, self.strip_accents).strip()
+        if not key or key in self._words:
+            return False
+        terminal, created = self._insert(key)
+        new_nodes = {node for _, _, node in created}
+        goto, fail, length, output = self._goto, self._fail, self._length, self._output
+        for parent, char, node in created:
+            # Lien du nouveau noeud : comme dans la construction complète
+            target = 0
+            if parent:
+                target = fail[parent]
+                while target and char not in goto[target]:
+                    target = fail[target]
+                target = goto[target].get(char, 0)
+            self._set_fail(node, target)
+            output[node] = target if length[target] else output[target]
+            # Noeuds existants dont le plus long suffixe présent devient ce noeud : enfants
+            # (par char) des noeuds dont la chaîne d'échec mène au parent. Un noeud ayant
+            # déjà un enfant par char masque toute sa descendance.
+            stack = list(self._fail_children.get(parent, ()))
+            while stack:
+                other = stack.pop()
+                child = goto[other].get(char)
+                if child is None:
+                    stack.extend(self._fail_children.get(other, ()))
+                elif child not in new_nodes:
+                    self._set_fail(child, node)
+        for _, _, node in created:
+            self._refresh_outputs(node)
+        self._refresh_outputs(terminal)
+        self._words[key] = word
+        return True
+
+    def remove(self, word):
+        key = normalize(word, self.strip_accents).strip()
+        if key not in self._words:
+            return False
+        node = 0
+        for char in key:
+            node = self._goto[node][char]
+        # Les noeuds restent dans le trie ; seul le marqueur de fin disparaît
+        self._length[node] = 0
+        self._refresh_outputs(node)
+        del self._words[key]
+        return True
+
+    def _set_fail(self, node, target):
+        children = self._fail_children.get(self._fail[node])
+        if children is not None:
+            children.discard(node)
+        self._fail[node] = target
+        self._fail_children.setdefault(target, set()).add(node)
+
+    def _refresh_outputs(self, node):
+        # Recalcule les sorties des noeuds dont la chaîne d'échec passe par node (node exclu)
+        fail, length, output = self._fail, self._length, self._output
+        stack = list(self._fail_children.get(node, ()))
+        while stack:
+            other = stack.pop()
+            target = fail[other]
+            output[other] = target if length[target] else output[target]
+            stack.extend(self._fail_children.get(other, ()))
+
+    def _build_links(self):
+        queue = collections.deque()
+        for child in self._goto[0].values():
+            self._set_fail(child, 0)
+            self._output[child] = -1
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._set_fail(child, fail)
+                self._output[child] = fail if self._length[fail] else self._output[fail]
+                queue.append(child)
+
+    def _is_boundary(self, text, start, end):
+        before = text[start - 1] if start > 0 else ' '
+        after = text[end] if end < len(text) else ' '
+        return not before.isalnum() and not after.isalnum()
+
+    def find(self, text):
+        # Renvoie le premier mot interdit trouvé, ou None
+        if not self._words:
+            return None
+        text = normalize(text, self.strip_accents)
+        goto, fail, length, output = self._goto, self._fail, self._length, self._output
+        word_mode = self.mode == 'word'
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if length[node] else output[node]
+            while match > 0:
+                end = i + 1
+                start = end - length[match]
+                if not word_mode or self._is_boundary(text, start, end):
+                    return self._words[text[start:end]]
+                match = output[match]
+        return None
+
+
+def get_filter(guild):
+    # Un automate par serveur, compilé à la première utilisation et gardé
+    # avec les données du serveur (libéré quand le serveur sort du cache)
+    word_filter = guild.get('word_filter')
+    if word_filter is None:
+        word_filter = guild['word_filter'] = WordFilter(guild['banned_words'])
+    return word_filter
@@ -0,0 +1,118 @@
+import asyncio
+import atexit
+import bisect
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Configuration de l'XP (variables d'environnement)
+XP_MIN = int(os.getenv('XP_MIN', '15'))
+XP_MAX = int(os.getenv('XP_MAX', '25'))
+XP_COOLDOWN = float(os.getenv('XP_COOLDOWN', '60'))
+XP_FLUSH_INTERVAL = float(os.getenv('XP_FLUSH_INTERVAL', '30'))
+XP_IDLE_EVICT = float(os.getenv('XP_IDLE_EVICT', '600'))
+MAX_LEVEL = 500
+
+
+def _level_thresholds(max_level=MAX_LEVEL):
+    # XP totale nécessaire pour atteindre chaque niveau (5n² + 50n + 100 par niveau)
+    thresholds = [0]
+    for level in range(max_level):
+        thresholds.append(thresholds[-1] + 5 * level * level + 50 * level + 100)
+    return thresholds
+
+
+LEVEL_THRESHOLDS = _level_thresholds()
+
+
+def level_for_xp(xp):
+    return bisect.bisect_right(LEVEL_THRESHOLDS, xp) - 1
+
+
+class XPEngine:
+    # Accumule l'XP en mémoire et n'envoie au stockage que les membres modifiés,
+    # par lots, toutes les XP_FLUSH_INTERVAL secondes.
+
+    def __init__(self, backend, flush_interval=XP_FLUSH_INTERVAL, cooldown=XP_COOLDOWN):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.cooldown = cooldown
+        self._members = {}  # (guild_id, user_id) -> [xp, niveau, dernier gain]
+        self._dirty = set()
+        self._task = None
+        self.listeners = []  # appelés avec (guild_id, user_id, nouvelle xp)
+        # Métriques
+        self.awarded = 0
+        self.skipped = 0
+        self.flushed = 0
+        atexit.register(self.flush)
+
+    def _member(self, guild_id, user_id):
+        key = (guild_id, user_id)
+        member = self._members.get(key)
+        if member is None:
+            # Niveau recalculé depuis l'XP : les niveaux importés de data.json suivaient
+            # une autre formule, !rank et !leaderboard doivent afficher le même
+            xp, _ = self.backend.get_member(guild_id, user_id)
+            member = self._members[key] = [xp, level_for_xp(xp), float('-inf')]
+        return member
+
+    def get(self, guild_id, user_id):
+        xp, level, _ = self._member(guild_id, user_id)
+        return xp, level
+
+    def award(self, guild_id, user_id, now=None):
+        # Renvoie le nouveau niveau en cas de passage de niveau, sinon None
+        now = now or time.monotonic()
+        member = self._member(guild_id, user_id)
+        if now - member[2] < self.cooldown:
+            self.skipped += 1
+            return None
+        member[0] += random.randint(XP_MIN, XP_MAX)
+        member[2] = now
+        self._dirty.add((guild_id, user_id))
+        self.awarded += 1
+        for listener in self.listeners:
+            listener(guild_id, user_id, member[0])
+        new_level = level_for_xp(member[0])
+        if new_level > member[1]:
+            member[1] = new_level
+            return new_level
+        return None
+
+    def flush(self):
+        if self._dirty:
+            dirty, self._dirty = self._dirty, set()
+            rows = [(guild_id, user_id, self._members[(guild_id, user_id)][0], self._members[(guild_id, user_id)][1])
+                    for guild_id, user_id in dirty]
+            self.backend.write_members(rows)
+            self.flushed += len(rows)
+            logger.info("XP : %s membre(s) envoyé(s) au stockage", len(rows))
+        # Libère les membres inactifs déjà enregistrés
+        limit = time.monotonic() - max(XP_IDLE_EVICT, self.cooldown)
+        for key in [key for key, member in self._members.items() if member[2] < limit and key not in self._dirty]:
+            del self._members[key]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Erreur lors de l'enregistrement de l'XP : %s", e)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stats(self):
+        return {
+            'members_in_memory': len(self._members),
+            'dirty': len(self._dirty),
+            'awarded': self.awarded,
+            'skipped_cooldown': self.skipped,
+            'flushed': self.flushed,
+        }